@@ -19,5 +19,50 @@ CHATS_CSV_TEMPLATE = "telegram_chats_{session}.csv"
 DIALOGS_JSON_TEMPLATE = "telegram_dialogs_{session}.json"
 CHAT_MEMBERS_CSV_TEMPLATE = "telegram_chat_members_{session}.csv"
 CHAT_MEMBERS_JSON_TEMPLATE = "telegram_chat_members_{session}.json"
+CHAT_MEMBERS_JSONL_TEMPLATE = "telegram_chat_members_{session}.jsonl"
+# Ids of chats with all members exported, one per line
+CHAT_MEMBERS_PROCESSED_TEMPLATE = "chat_members_processed_{session}.log"
 NICKNAMES_MATCHES_CSV_TEMPLATE = "telegram_nicknames_matches_{session}.csv"
 NICKNAMES_MATCHES_JSON_TEMPLATE = "telegram_nicknames_matches_{session}.json"
+
+# Column order of chat member rows (rows are tuples in this order)
+CHAT_MEMBER_FIELDS = (
+    "chat_id",
+    "chat_title",
+    "chat_type",
+    "user_id",
+    "first_name",
+    "last_name",
+    "username",
+    "phone",
+    "is_bot",
+    "is_premium",
+    "is_verified",
+)
+
+# Write exported .json files as JSON Lines (one record per line).
+# Set to False to get a pretty-printed JSON array instead.
+JSON_LINES_OUTPUT = True
+
+# Gzip chat member .json/.jsonl files (adds .gz); cross-reference reads both
+COMPRESS_CHAT_MEMBERS = False
+
+# Minimum seconds between intermediate progress file writes
+PROGRESS_SAVE_INTERVAL = 1.0
+# Contacts/chats processed between progress checkpoints
+PROGRESS_BATCH_SIZE = 100
+# Worker threads for export file writes and reads
+FILE_IO_WORKERS = 2
+
+# Telegram API limits
+MAX_CONCURRENT_REQUESTS = 8  # Requests in flight across all running exports
+PARTICIPANTS_PAGE_SIZE = 200  # Server-side cap for GetParticipantsRequest
+PARTICIPANTS_PAGES_CONCURRENCY = 4  # Pages of one channel fetched in parallel
+CHAT_MEMBERS_CONCURRENCY = 8  # Chats fetched in parallel
+CHAT_MEMBERS_WRITE_BATCH = 5000  # Member rows written at once while fetching
+DIALOGS_CACHE_TTL = 60  # Seconds to reuse fetched dialogs between exports
+FLOOD_WAIT_RETRIES = 3  # Retries of a request after waiting out FloodWait
+
+# Exported chat members with a username kept in memory for nickname
+# cross-reference; larger exports are re-read from disk instead
+MEMBERS_MEMORY_CACHE_LIMIT = 50000
@@ -1,25 +1,266 @@
 """File management operations for Telegram exporter."""
 
-import csv
-import json
+import gzip
 import os
-from datetime import datetime
-from typing import Dict, List, Set
+import threading
+import time
+from contextlib import suppress
+from datetime import datetime, timezone
+from itertools import chain
+from operator import itemgetter
+from typing import (
+    IO,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 from config import (
+    CHAT_MEMBER_FIELDS,
     CHAT_MEMBERS_CSV_TEMPLATE,
     CHAT_MEMBERS_JSON_TEMPLATE,
+    CHAT_MEMBERS_JSONL_TEMPLATE,
+    CHAT_MEMBERS_PROCESSED_TEMPLATE,
     CHATS_CSV_TEMPLATE,
+    COMPRESS_CHAT_MEMBERS,
     CONTACTS_CSV_TEMPLATE,
     CONTACTS_JSON_TEMPLATE,
     DIALOGS_JSON_TEMPLATE,
     EXPORTS_DIR,
+    JSON_LINES_OUTPUT,
     LEGACY_CREDENTIALS_FILE,
+    MEMBERS_MEMORY_CACHE_LIMIT,
     NICKNAMES_FILE,
     NICKNAMES_MATCHES_CSV_TEMPLATE,
     NICKNAMES_MATCHES_JSON_TEMPLATE,
     PROGRESS_FILE_TEMPLATE,
+    PROGRESS_SAVE_INTERVAL,
+)
+from json_utils import dumps, iter_records, loads, write_atomic
+
+# Buffer for bulk export writes; one-shot writes of a prebuilt blob skip it
+WRITE_BUFFER_SIZE = 1 << 20
+# Raised for a gzip file cut off inside a member header (OSError before 3.8)
+_BadGzipFile = getattr(gzip, "BadGzipFile", OSError)
+_MEMBER_USERNAME = CHAT_MEMBER_FIELDS.index("username")
+# Member record dict -> row tuple, and per-field defaults for old files
+_member_row = itemgetter(*CHAT_MEMBER_FIELDS)
+_MEMBER_DEFAULTS = tuple(
+    (name, False if name.startswith("is_") else "") for name in CHAT_MEMBER_FIELDS
+)
+
+# Column order of exported files
+CONTACT_FIELDS = (
+    "id",
+    "first_name",
+    "last_name",
+    "username",
+    "phone",
+    "is_bot",
+    "is_contact",
+)
+CHAT_FIELDS = (
+    "id",
+    "first_name",
+    "last_name",
+    "username",
+    "phone",
+    "is_contact",
+    "last_message_date",
+    "unread_count",
 )
+MATCH_FIELDS = (
+    "source",
+    "found_in_chat",
+    "chat_id",
+    "id",
+    "first_name",
+    "last_name",
+    "username",
+    "phone",
+    "is_bot",
+    "is_contact",
+    "is_premium",
+    "is_verified",
+    "last_message_date",
+    "unread_count",
+    "matched_nick",
+)
+
+
+def _csv_field(value) -> str:
+    """Format a single CSV field, quoting only when required."""
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return str(value)
+    if '"' in value:
+        return '"' + value.replace('"', '""') + '"'
+    if "," in value or "\n" in value or "\r" in value:
+        return '"' + value + '"'
+    return value
+
+
+def _csv_row(row: Dict, fieldnames: Sequence[str]) -> str:
+    """Format dict row as a CSV line."""
+    return ",".join([_csv_field(row.get(name, "")) for name in fieldnames]) + "\r\n"
+
+
+class _IndentedArrayWriter:
+    """Write records to a binary file as an indented JSON array.
+
+    Records can be written in any number of calls; after finish() the
+    file holds dumps(records, indent=True).
+    """
+
+    def __init__(self, f: IO[bytes]):
+        self._f = f
+        self.count = 0
+
+    def write_many(self, records: Iterable):
+        self._f.writelines(self._chunks(records))
+
+    def _chunks(self, records: Iterable) -> Iterator[bytes]:
+        for record in records:
+            separator = b",\n" if self.count else b"[\n"
+            yield separator + b"  " + dumps(record, indent=True).replace(b"\n", b"\n  ")
+            self.count += 1
+
+    def finish(self):
+        self._f.write(b"\n]" if self.count else b"[]")
+
+
+def _open_members_file(path: str, mode: str):
+    """Open chat members JSON file, gzip-compressed if its name ends in .gz."""
+    if path.endswith(".gz"):
+        # Level 1 keeps compression far cheaper than the bytes it saves
+        return gzip.open(path, mode, compresslevel=1)
+    return open(path, mode, buffering=WRITE_BUFFER_SIZE)
+
+
+def _truncate_to_last_line(path: str):
+    """Cut a line left half-written by a hard kill off the end of a file."""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        keep = 0
+        pos = end
+        while pos > 0:
+            start = max(0, pos - 65536)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b"\n")
+            if newline != -1:
+                keep = start + newline + 1
+                break
+            pos = start
+        if keep != end:
+            f.truncate(keep)
+
+
+def _repair_members_jsonl(path: str):
+    """Drop a record left half-written by a hard kill from a JSON Lines file.
+
+    Appending after it would bury a broken line, or for gzip a broken
+    member, in the middle of the file; reading it fails outright.
+    """
+    if not path.endswith(".gz"):
+        _truncate_to_last_line(path)
+        return
+
+    try:
+        with gzip.open(path, "rb") as f:
+            while f.read(WRITE_BUFFER_SIZE):
+                pass
+        return
+    except (EOFError, _BadGzipFile):
+        pass
+
+    # Keep the complete lines of the damaged file
+    tmp_path = path[: -len(".gz")] + ".tmp.gz"
+    with gzip.open(path, "rb") as src, gzip.open(
+        tmp_path, "wb", compresslevel=1
+    ) as dst:
+        try:
+            for line in src:
+                if line.endswith(b"\n"):
+                    dst.write(line)
+        except (EOFError, _BadGzipFile):
+            pass
+    os.replace(tmp_path, path)
+
+
+class _RecordsWriter:
+    """Write the same records to CSV and JSON files one at a time.
+
+    JSON output is JSON Lines or an indented array equal to
+    dumps(records, indent=True); the array is closed on exit.
+    """
+
+    def __init__(self, csv_path: str, json_path: str, fieldnames: Sequence[str]):
+        self.fieldnames = fieldnames
+        self.count = 0
+        self._csv = open(
+            csv_path, "w", newline="", encoding="utf-8", buffering=WRITE_BUFFER_SIZE
+        )
+        try:
+            self._json = open(json_path, "wb", buffering=WRITE_BUFFER_SIZE)
+        except BaseException:
+            self._csv.close()
+            raise
+        self._csv.write(",".join(fieldnames) + "\r\n")
+        self._array = None if JSON_LINES_OUTPUT else _IndentedArrayWriter(self._json)
+
+    def write_many(self, records: Sequence[Dict]):
+        fieldnames = self.fieldnames
+        self._csv.writelines([_csv_row(record, fieldnames) for record in records])
+        if self._array is None:
+            self._json.writelines([dumps(record) + b"\n" for record in records])
+        else:
+            self._array.write_many(records)
+        self.count += len(records)
+
+    def close(self):
+        try:
+            if self._array is not None:
+                self._array.finish()
+        finally:
+            self._json.close()
+            self._csv.close()
+
+    def __enter__(self) -> "_RecordsWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _save_records(
+    csv_path: str,
+    json_path: str,
+    fieldnames: Sequence[str],
+    records: List[Dict],
+    on_progress: Optional[Callable[[int], None]],
+    progress_step: int,
+):
+    """Write records to CSV and JSON files in slices of progress_step.
+
+    on_progress, if given, is called with the number written so far after
+    each slice; without it everything is written at once.
+    """
+    step = progress_step if on_progress is not None else max(1, len(records))
+    with _RecordsWriter(csv_path, json_path, fieldnames) as writer:
+        for start in range(0, len(records), step):
+            writer.write_many(records[start : start + step])
+            if on_progress is not None:
+                on_progress(writer.count)
 
 
 class FileManager:
@@ -28,24 +269,58 @@ class FileManager:
     def __init__(self):
         self.current_session = None
         self.exports_dir = EXPORTS_DIR
+        self._last_progress_write = 0.0
+        # Progress may be loaded and saved from worker threads; reentrant
+        # since save_progress() loads the cached progress under it
+        self._progress_lock = threading.RLock()
+        # Session directories already created and computed file paths
+        self._ready_dirs: Set[str] = set()
+        self._path_cache: Dict[Tuple[str, str, str], str] = {}
+        # Chat member files stay open between appended batches
+        self._members_csv_fh: Optional[IO[str]] = None
+        self._members_jsonl_fh: Optional[IO[bytes]] = None
+        self._processed_log_fh: Optional[IO[str]] = None
+        self._clear_session_cache()
         self.ensure_exports_dir()
 
     def set_session(self, session_name: str):
         """Set current session for file operations."""
+        self.close_member_writers()
+        self.flush_progress()
         self.current_session = session_name
+        self._clear_session_cache()
         self.ensure_session_dir()
 
+    def _clear_session_cache(self):
+        """Forget data cached for the previous session."""
+        # Parsed progress file and the (mtime_ns, size) it was read at
+        self._progress_cache: Optional[Dict] = None
+        self._progress_stat: Optional[Tuple[int, int]] = None
+        # Cached progress has updates not yet written to disk
+        self._progress_dirty = False
+        # Copies of what was last written to the session's export files,
+        # so cross-reference right after an export skips re-reading them
+        self._last_contacts: Optional[List[Dict]] = None
+        self._last_chats: Optional[List[Dict]] = None
+        self._last_members: Optional[List[Tuple]] = None
+        # Whether this session's member stream was opened and still
+        # expects its first batch
+        self._members_stream_opened = False
+        self._members_new_file = False
+        # Member JSON Lines files found intact, with their (mtime_ns, size)
+        self._members_checked: Dict[str, Tuple[int, int]] = {}
+
     def ensure_exports_dir(self):
         """Ensure exports directory exists."""
-        if not os.path.exists(self.exports_dir):
-            os.makedirs(self.exports_dir)
+        os.makedirs(self.exports_dir, exist_ok=True)
 
     def ensure_session_dir(self):
         """Ensure session-specific directory exists."""
         if self.current_session:
             session_dir = self.get_session_dir()
-            if not os.path.exists(session_dir):
-                os.makedirs(session_dir)
+            if session_dir not in self._ready_dirs:
+                os.makedirs(session_dir, exist_ok=True)
+                self._ready_dirs.add(session_dir)
 
     def get_session_dir(self) -> str:
         """Get session-specific directory path."""
@@ -57,8 +332,14 @@ class FileManager:
         """Get full path for a session-specific file."""
         if not self.current_session:
             raise ValueError("No session set")
-        filename = template.format(session=self.current_session)
-        return os.path.join(self.get_session_dir(), filename)
+        key = (self.exports_dir, self.current_session, template)
+        path = self._path_cache.get(key)
+        if path is None:
+            filename = template.format(session=self.current_session)
+            path = self._path_cache[key] = os.path.join(
+                self.get_session_dir(), filename
+            )
+        return path
 
     @property
     def progress(self) -> Dict:
@@ -70,39 +351,91 @@ class FileManager:
         if not self.current_session:
             return {}
 
-        progress_file = self.get_session_file_path(PROGRESS_FILE_TEMPLATE)
-        if os.path.exists(progress_file):
-            with open(progress_file, encoding="utf-8") as f:
-                return json.load(f)
-        return {}
+        # A reparse racing a save would replace its update with stale data
+        with self._progress_lock:
+            if self._progress_dirty:
+                return self._progress_cache
 
-    def save_progress(self, export_type: str, data: Dict):
-        """Save export progress to session-specific file."""
+            progress_file = self.get_session_file_path(PROGRESS_FILE_TEMPLATE)
+            try:
+                st = os.stat(progress_file)
+            except FileNotFoundError:
+                self._progress_cache = None
+                return {}
+
+            # Reparse only when the file changed since it was last read
+            stat_key = (st.st_mtime_ns, st.st_size)
+            if self._progress_cache is None or self._progress_stat != stat_key:
+                with open(progress_file, "rb") as f:
+                    self._progress_cache = loads(f.read())
+                self._progress_stat = stat_key
+            return self._progress_cache
+
+    def save_progress(
+        self,
+        export_type: str,
+        data: Dict,
+        flush: bool = False,
+        defer_finished: bool = False,
+    ):
+        """Save export progress to session-specific file.
+
+        Updates always land in the cached progress, but the file is written
+        at most once per PROGRESS_SAVE_INTERVAL; saves with finished=True or
+        flush=True are written at once and flush_progress() writes any
+        pending updates. Use flush for checkpoints that must not fall behind
+        data already written to the export files, and defer_finished to
+        throttle a finished save too when several exports finishing
+        together are written with one flush_progress().
+        """
         if not self.current_session:
             raise ValueError("No session set")
 
-        # Load current progress
-        current_progress = self.load_progress()
-
-        # Update with new data
-        current_progress[export_type] = {
-            "timestamp": datetime.now().isoformat(),
-            "completed": data.get("completed", 0),
-            "total": data.get("total", 0),
-            "finished": data.get("finished", False),
-            "processed_items": data.get("processed_items", []),
-        }
-
-        # Save to session-specific file
+        with self._progress_lock:
+            finished = data.get("finished", False)
+
+            # Load current progress
+            current_progress = self.load_progress()
+
+            # Update with new data
+            current_progress[export_type] = {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "completed": data.get("completed", 0),
+                "total": data.get("total", 0),
+                "finished": finished,
+            }
+            self._progress_cache = current_progress
+            self._progress_dirty = True
+
+            now = time.monotonic()
+            if (
+                (finished and not defer_finished)
+                or flush
+                or now - self._last_progress_write >= PROGRESS_SAVE_INTERVAL
+            ):
+                self._write_progress()
+
+    def flush_progress(self):
+        """Write progress updates held back by save_progress throttling."""
+        with self._progress_lock:
+            if self._progress_dirty:
+                self._write_progress()
+
+    def _write_progress(self):
+        """Write cached progress to disk; caller holds the progress lock."""
+        # Swapped in whole so an interrupted save never leaves a truncated
+        # progress file behind
         progress_file = self.get_session_file_path(PROGRESS_FILE_TEMPLATE)
-        with open(progress_file, "w", encoding="utf-8") as f:
-            json.dump(current_progress, f, ensure_ascii=False, indent=2)
+        st = write_atomic(progress_file, dumps(self._progress_cache))
+        self._progress_stat = (st.st_mtime_ns, st.st_size)
+        self._progress_dirty = False
+        self._last_progress_write = time.monotonic()
 
     def load_credentials(self) -> Dict:
         """Load saved credentials from legacy file (for backward compatibility)."""
         if os.path.exists(LEGACY_CREDENTIALS_FILE):
-            with open(LEGACY_CREDENTIALS_FILE, encoding="utf-8") as f:
-                return json.load(f)
+            with open(LEGACY_CREDENTIALS_FILE, "rb") as f:
+                return loads(f.read())
         return {}
 
     def save_credentials(self, api_id: str, api_hash: str, phone: str):
@@ -112,130 +445,354 @@ class FileManager:
             "api_hash": api_hash,
             "phone": phone,
         }
-        with open(LEGACY_CREDENTIALS_FILE, "w", encoding="utf-8") as f:
-            json.dump(credentials, f, ensure_ascii=False, indent=2)
+        with open(LEGACY_CREDENTIALS_FILE, "wb") as f:
+            f.write(dumps(credentials, indent=True))
         print(f"💾 Учетные данные сохранены в {LEGACY_CREDENTIALS_FILE}")
 
-    def save_contacts_to_files(self, contacts: List[Dict]) -> int:
-        """Save contacts to session-specific CSV and JSON files."""
+    def save_contacts_to_files(
+        self,
+        contacts: List[Dict],
+        on_progress: Optional[Callable[[int], None]] = None,
+        progress_step: int = 1,
+    ) -> int:
+        """Save contacts to session-specific CSV and JSON files.
+
+        on_progress, if given, is called with the number of contacts written
+        so far after every progress_step of them and after the last one.
+        """
         if not self.current_session:
             raise ValueError("No session set")
 
         contacts_csv = self.get_session_file_path(CONTACTS_CSV_TEMPLATE)
         contacts_json = self.get_session_file_path(CONTACTS_JSON_TEMPLATE)
 
-        with open(contacts_csv, "w", newline="", encoding="utf-8") as csvfile:
-            fieldnames = [
-                "id",
-                "first_name",
-                "last_name",
-                "username",
-                "phone",
-                "is_bot",
-                "is_contact",
-            ]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(contacts)
-
-        with open(contacts_json, "w", encoding="utf-8") as f:
-            json.dump(contacts, f, ensure_ascii=False, indent=2)
+        _save_records(
+            contacts_csv,
+            contacts_json,
+            CONTACT_FIELDS,
+            contacts,
+            on_progress,
+            progress_step,
+        )
+        self._last_contacts = contacts
 
         print(
             f"📁 Контакты сохранены в {os.path.basename(contacts_csv)} и {os.path.basename(contacts_json)}"
         )
         return len(contacts)
 
-    def save_chats_to_files(self, chats: List[Dict]) -> int:
-        """Save chats to session-specific CSV and JSON files."""
+    def save_chats_to_files(
+        self,
+        chats: List[Dict],
+        on_progress: Optional[Callable[[int], None]] = None,
+        progress_step: int = 1,
+    ) -> int:
+        """Save chats to session-specific CSV and JSON files.
+
+        on_progress, if given, is called with the number of chats written
+        so far after every progress_step of them and after the last one.
+        """
         if not self.current_session:
             raise ValueError("No session set")
 
         chats_csv = self.get_session_file_path(CHATS_CSV_TEMPLATE)
         dialogs_json = self.get_session_file_path(DIALOGS_JSON_TEMPLATE)
 
-        with open(chats_csv, "w", newline="", encoding="utf-8") as csvfile:
-            fieldnames = [
-                "id",
-                "first_name",
-                "last_name",
-                "username",
-                "phone",
-                "is_contact",
-                "last_message_date",
-                "unread_count",
-            ]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(chats)
-
-        with open(dialogs_json, "w", encoding="utf-8") as f:
-            json.dump(chats, f, ensure_ascii=False, indent=2)
+        _save_records(
+            chats_csv, dialogs_json, CHAT_FIELDS, chats, on_progress, progress_step
+        )
+        self._last_chats = chats
 
         print(
             f"📁 Чаты сохранены в {os.path.basename(chats_csv)} и {os.path.basename(dialogs_json)}"
         )
         return len(chats)
 
-    def save_chat_members_to_files(
-        self, members: List[Dict], append: bool = False
-    ) -> int:
-        """Save chat members to session-specific CSV and JSON files."""
-        if not members:
-            return 0
+    def open_chat_members_stream(self, append: bool = False):
+        """Open the chat member files for an export.
 
+        The CSV and JSON Lines files stay open, buffered, for every batch
+        saved by save_chat_members_to_files() until close_member_writers().
+        With append=False the files are started over; otherwise batches go
+        after the rows of an interrupted export.
+        """
         if not self.current_session:
             raise ValueError("No session set")
 
+        self.close_member_writers()
+
         members_csv = self.get_session_file_path(CHAT_MEMBERS_CSV_TEMPLATE)
-        members_json = self.get_session_file_path(CHAT_MEMBERS_JSON_TEMPLATE)
+        members_json, members_jsonl = self._members_json_paths()
 
         # For CSV, we need to handle append mode carefully
-        mode = "a" if append and os.path.exists(members_csv) else "w"
         write_header = not (append and os.path.exists(members_csv))
+        if append:
+            # A hard kill may have cut the last rows short
+            if not write_header:
+                _truncate_to_last_line(members_csv)
+            if os.path.exists(members_jsonl):
+                self._repair_members_file(members_jsonl)
+
+        # Resuming an export that was already finalized or made by an
+        # older version: carry over members from the JSON file
+        if append and not os.path.exists(members_jsonl):
+            existing_json = self._find_members_file(jsonl=False)
+            if existing_json:
+                self._convert_members_json_to_jsonl(existing_json, members_jsonl)
+
+        self._members_csv_fh = open(
+            members_csv,
+            "w" if write_header else "a",
+            newline="",
+            encoding="utf-8",
+            buffering=WRITE_BUFFER_SIZE,
+        )
+        if write_header:
+            self._members_csv_fh.write(",".join(CHAT_MEMBER_FIELDS) + "\r\n")
+        # Gzip batches are written as separate members on the raw file
+        self._members_jsonl_fh = open(
+            members_jsonl, "ab" if append else "wb", buffering=WRITE_BUFFER_SIZE
+        )
 
-        with open(members_csv, mode, newline="", encoding="utf-8") as csvfile:
-            fieldnames = [
-                "chat_id",
-                "chat_title",
-                "chat_type",
-                "user_id",
-                "first_name",
-                "last_name",
-                "username",
-                "phone",
-                "is_bot",
-                "is_premium",
-                "is_verified",
-            ]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            if write_header:
-                writer.writeheader()
-            writer.writerows(members)
-
-        # For JSON, load existing data and append
-        existing_members = []
-        if append and os.path.exists(members_json):
-            try:
-                with open(members_json, encoding="utf-8") as f:
-                    existing_members = json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                existing_members = []
+        # Members already on disk from a resumed run are not in memory, so
+        # the copy is only kept when it covers the whole file
+        if write_header:
+            self._last_members = []
+        self._members_new_file = not append
+        self._members_stream_opened = True
+
+    def save_chat_members_to_files(self, members: List[Tuple]) -> int:
+        """Save chat members to session-specific CSV and JSON Lines files.
+
+        Members are tuples ordered as CHAT_MEMBER_FIELDS. They are appended to
+        a JSON Lines file so each batch costs only its own size;
+        finalize_chat_members() builds the JSON array file from it.
+
+        Batches go to the files opened by open_chat_members_stream(); without
+        one, the files are started over, or appended to if they were closed
+        mid-export. Every batch is flushed so a chat marked processed after
+        it never runs ahead of the files; resuming drops rows of unmarked
+        chats that are already on disk.
+        """
+        if not members:
+            return 0
+
+        if self._members_csv_fh is None:
+            self.open_chat_members_stream(append=self._members_stream_opened)
 
-        all_members = existing_members + members if append else members
+        if self._last_members is not None:
+            # Only members with a username can match a contact nickname
+            self._last_members.extend(
+                member for member in members if member[_MEMBER_USERNAME]
+            )
+            if len(self._last_members) > MEMBERS_MEMORY_CACHE_LIMIT:
+                self._last_members = None
 
-        with open(members_json, "w", encoding="utf-8") as f:
-            json.dump(all_members, f, ensure_ascii=False, indent=2)
+        self._members_csv_fh.writelines(
+            ",".join(map(_csv_field, member)) + "\r\n" for member in members
+        )
+        self._members_csv_fh.flush()
+        lines = [
+            dumps(dict(zip(CHAT_MEMBER_FIELDS, member))) + b"\n" for member in members
+        ]
+        if self._members_jsonl_fh.name.endswith(".gz"):
+            # A complete gzip member per batch keeps the file readable if
+            # the program is killed before the files are closed
+            with gzip.GzipFile(
+                fileobj=self._members_jsonl_fh, mode="wb", compresslevel=1
+            ) as gz:
+                gz.writelines(lines)
+        else:
+            self._members_jsonl_fh.writelines(lines)
+        self._members_jsonl_fh.flush()
 
+        members_csv = self.get_session_file_path(CHAT_MEMBERS_CSV_TEMPLATE)
+        members_json, _ = self._members_json_paths()
         csv_name = os.path.basename(members_csv)
         json_name = os.path.basename(members_json)
 
-        if not append:
+        if self._members_new_file:
+            self._members_new_file = False
             print(f"📁 Участники чатов сохранены в {csv_name} и {json_name}")
         else:
             print(f"📁 Добавлено {len(members)} участников в {csv_name} и {json_name}")
         return len(members)
 
+    def written_member_ids(self, chat_ids: Iterable[int]) -> Dict[int, Set[int]]:
+        """Get user ids already in the chat members file for the given chats.
+
+        Resuming must not repeat rows of chats that were cut off mid-write
+        or finished after the last saved progress.
+        """
+        wanted = set(chat_ids)
+        written: Dict[int, Set[int]] = {}
+        if not wanted:
+            return written
+
+        self.close_member_writers()
+        members_json = self._find_members_file()
+        if members_json is None:
+            return written
+
+        members_jsonl = self.get_session_file_path(CHAT_MEMBERS_JSONL_TEMPLATE)
+        if members_json in (members_jsonl, members_jsonl + ".gz"):
+            # Members still being appended may end in a cut-off record
+            self._repair_members_file(members_json)
+
+        with _open_members_file(members_json, "rb") as f:
+            for member in iter_records(f):
+                chat_id = member.get("chat_id")
+                if chat_id in wanted:
+                    written.setdefault(chat_id, set()).add(member.get("user_id"))
+        return written
+
+    def _repair_members_file(self, path: str):
+        """Repair a chat members JSON Lines file unless already checked.
+
+        Checking a gzip file means decompressing it, so the result is kept
+        for as long as the file's (mtime_ns, size) stays the same.
+        """
+        st = os.stat(path)
+        if self._members_checked.get(path) == (st.st_mtime_ns, st.st_size):
+            return
+        _repair_members_jsonl(path)
+        st = os.stat(path)
+        self._members_checked[path] = (st.st_mtime_ns, st.st_size)
+
+    def load_processed_chat_ids(self) -> Set[int]:
+        """Get ids of chats whose members were all exported.
+
+        Progress files of older versions list them under processed_items;
+        they are copied into the log, since the next progress save drops
+        that list.
+        """
+        if not self.current_session:
+            raise ValueError("No session set")
+
+        log_path = self.get_session_file_path(CHAT_MEMBERS_PROCESSED_TEMPLATE)
+        processed: Set[int] = set()
+        try:
+            with open(log_path, encoding="utf-8") as f:
+                processed.update(int(line) for line in f if line.strip())
+        except FileNotFoundError:
+            pass
+
+        chat_progress = self.load_progress().get("chat_members", {})
+        legacy = set(chat_progress.get("processed_items", ())) - processed
+        if legacy:
+            self._log_processed_chats(legacy)
+            processed |= legacy
+        return processed
+
+    def mark_chat_processed(self, chat_id: int):
+        """Append a chat to the processed chats log.
+
+        The log only grows by one line per chat, so progress checkpoints
+        stay small however many chats were exported.
+        """
+        if not self.current_session:
+            raise ValueError("No session set")
+
+        self._log_processed_chats((chat_id,))
+
+    def _log_processed_chats(self, chat_ids: Iterable[int]):
+        """Append chat ids to the processed chats log, kept open."""
+        if self._processed_log_fh is None:
+            self._processed_log_fh = open(
+                self.get_session_file_path(CHAT_MEMBERS_PROCESSED_TEMPLATE),
+                "a",
+                encoding="utf-8",
+            )
+        self._processed_log_fh.writelines(f"{chat_id}\n" for chat_id in chat_ids)
+        self._processed_log_fh.flush()
+
+    def reset_processed_chats(self):
+        """Start the processed chats log over for a new export."""
+        if not self.current_session:
+            raise ValueError("No session set")
+
+        self.close_member_writers()
+        log_path = self.get_session_file_path(CHAT_MEMBERS_PROCESSED_TEMPLATE)
+        with suppress(FileNotFoundError):
+            os.unlink(log_path)
+
+    def close_member_writers(self):
+        """Close chat member files kept open between appended batches."""
+        for fh in (
+            self._members_csv_fh,
+            self._members_jsonl_fh,
+            self._processed_log_fh,
+        ):
+            if fh is not None:
+                fh.close()
+        self._members_csv_fh = None
+        self._members_jsonl_fh = None
+        self._processed_log_fh = None
+
+    def finalize_chat_members(self):
+        """Move appended chat members into the final JSON file."""
+        if not self.current_session:
+            raise ValueError("No session set")
+
+        self.close_member_writers()
+
+        members_json, members_jsonl = self._members_json_paths()
+        if not os.path.exists(members_jsonl):
+            return
+
+        if JSON_LINES_OUTPUT:
+            os.replace(members_jsonl, members_json)
+            return
+
+        # Stream records into an indented array without loading them all
+        with _open_members_file(members_jsonl, "rb") as src, _open_members_file(
+            members_json, "wb"
+        ) as dst:
+            array = _IndentedArrayWriter(dst)
+            array.write_many(loads(line) for line in src if line.strip())
+            array.finish()
+
+        os.remove(members_jsonl)
+
+    def _members_json_paths(self) -> Tuple[str, str]:
+        """Get chat members JSON and JSON Lines paths to write."""
+        suffix = ".gz" if COMPRESS_CHAT_MEMBERS else ""
+        return (
+            self.get_session_file_path(CHAT_MEMBERS_JSON_TEMPLATE) + suffix,
+            self.get_session_file_path(CHAT_MEMBERS_JSONL_TEMPLATE) + suffix,
+        )
+
+    def _find_members_file(self, jsonl: bool = True) -> Optional[str]:
+        """Find an existing chat members file, plain or gzip-compressed.
+
+        An export that was interrupted before finalizing keeps its newest
+        members in the JSON Lines file, so it is preferred when jsonl is set.
+        """
+        templates = [CHAT_MEMBERS_JSON_TEMPLATE]
+        if jsonl:
+            templates.insert(0, CHAT_MEMBERS_JSONL_TEMPLATE)
+        # Files in the configured format come first
+        suffixes = (".gz", "") if COMPRESS_CHAT_MEMBERS else ("", ".gz")
+        for template in templates:
+            path = self.get_session_file_path(template)
+            for suffix in suffixes:
+                if os.path.exists(path + suffix):
+                    return path + suffix
+        return None
+
+    @staticmethod
+    def _convert_members_json_to_jsonl(members_json: str, members_jsonl: str):
+        """Convert chat members JSON file to JSON Lines file."""
+        try:
+            with _open_members_file(members_json, "rb") as src, _open_members_file(
+                members_jsonl, "wb"
+            ) as dst:
+                dst.writelines(dumps(member) + b"\n" for member in iter_records(src))
+        except Exception as e:
+            print(
+                f"⚠️ Не удалось перенести участников из {os.path.basename(members_json)}: {e}"
+            )
+
     def load_nicknames_list(self) -> Set[str]:
         """Load list of nicknames from nicknames.txt file."""
         if not os.path.exists(NICKNAMES_FILE):
@@ -244,7 +801,8 @@ class FileManager:
 
         try:
             with open(NICKNAMES_FILE, encoding="utf-8") as f:
-                nicknames_set = {line.strip().lower() for line in f if line.strip()}
+                lines = f.read().splitlines()
+            nicknames_set = set(filter(None, map(str.lower, map(str.strip, lines))))
             print(f"📋 Загружено {len(nicknames_set)} ников из {NICKNAMES_FILE}")
             return nicknames_set
         except Exception as e:
@@ -255,55 +813,69 @@ class FileManager:
         """Cross-reference contacts and chats with nicknames file."""
         print("\n🔍 Сверка с файлом nicknames.txt...")
 
-        nicknames_set = self.load_nicknames_list()
+        # Members of an interrupted export may still sit in open files
+        self.close_member_writers()
+
+        nicknames_set = frozenset(self.load_nicknames_list())
         if not nicknames_set:
             return 0
 
-        matched_contacts = []
-
-        # Check contacts
-        matched_contacts.extend(self._check_contacts(nicknames_set))
-        # Check chats
-        matched_contacts.extend(self._check_chats(nicknames_set))
-        # Check chat members
-        matched_contacts.extend(self._check_chat_members(nicknames_set))
+        # Matches from all sources stream straight into the output files
+        counts = self._save_matches(
+            chain(
+                # Check contacts
+                self._check_contacts(nicknames_set),
+                # Check chats
+                self._check_chats(nicknames_set),
+                # Check chat members
+                self._check_chat_members(nicknames_set),
+            )
+        )
+        total = sum(counts.values())
 
-        if matched_contacts:
-            self._save_matches(matched_contacts)
-            self._print_statistics(matched_contacts)
+        if total:
+            self._print_statistics(counts)
         else:
             print("❌ Совпадений не найдено")
 
-        return len(matched_contacts)
+        return total
 
-    def _check_contacts(self, nicknames_set: Set[str]) -> List[Dict]:
-        """Check contacts for nickname matches."""
+    def _check_contacts(self, nicknames_set: FrozenSet[str]) -> Iterator[Dict]:
+        """Check contacts for nickname matches, yielding match records."""
         print("📞 Сверка контактов...")
-        matched = []
+        found = 0
 
         try:
             contacts_json = self.get_session_file_path(CONTACTS_JSON_TEMPLATE)
             if os.path.exists(contacts_json):
-                with open(contacts_json, encoding="utf-8") as f:
-                    contacts = json.load(f)
-
-                for contact in contacts:
-                    username = contact.get("username", "")
-                    if username and username.lower() in nicknames_set:
-                        contact_info = {
-                            "source": "contacts",
-                            "found_in_chat": "Контакты",
-                            "chat_id": "",
-                            "id": contact.get("id", ""),
-                            "first_name": contact.get("first_name", ""),
-                            "last_name": contact.get("last_name", ""),
-                            "username": username,
-                            "phone": contact.get("phone", ""),
-                            "is_bot": contact.get("is_bot", False),
-                            "matched_nick": username.lower(),
-                        }
-                        matched.append(contact_info)
-                        print(f"✅ Найден контакт: @{username}")
+                if self._last_contacts is not None:
+                    by_user = self._index_by_username(self._last_contacts)
+                else:
+                    with open(contacts_json, "rb") as f:
+                        by_user = self._index_by_username(iter_records(f))
+
+                for nick in sorted(nicknames_set & by_user.keys()):
+                    contact = by_user[nick]
+                    contact_info = {
+                        "source": "contacts",
+                        "found_in_chat": "Контакты",
+                        "chat_id": "",
+                        "id": contact.get("id", ""),
+                        "first_name": contact.get("first_name", ""),
+                        "last_name": contact.get("last_name", ""),
+                        "username": contact["username"],
+                        "phone": contact.get("phone", ""),
+                        "is_bot": contact.get("is_bot", False),
+                        "matched_nick": nick,
+                        "last_message_date": "",
+                        "unread_count": 0,
+                        "is_premium": False,
+                        "is_verified": False,
+                        "is_contact": True,
+                    }
+                    yield contact_info
+                    found += 1
+                print(f"✅ Найдено контактов: {found}")
             else:
                 print(
                     f"⚠️ Файл {os.path.basename(contacts_json)} не найден, пропускаем сверку контактов"
@@ -311,38 +883,41 @@ class FileManager:
         except Exception as e:
             print(f"❌ Ошибка при сверке контактов: {e}")
 
-        return matched
-
-    def _check_chats(self, nicknames_set: Set[str]) -> List[Dict]:
-        """Check chats for nickname matches."""
+    def _check_chats(self, nicknames_set: FrozenSet[str]) -> Iterator[Dict]:
+        """Check chats for nickname matches, yielding match records."""
         print("💬 Сверка чатов...")
-        matched = []
+        found = 0
 
         try:
             dialogs_json = self.get_session_file_path(DIALOGS_JSON_TEMPLATE)
             if os.path.exists(dialogs_json):
-                with open(dialogs_json, encoding="utf-8") as f:
-                    dialogs = json.load(f)
-
-                for dialog in dialogs:
-                    username = dialog.get("username", "")
-                    if username and username.lower() in nicknames_set:
-                        dialog_info = {
-                            "source": "chats",
-                            "found_in_chat": "Личные сообщения",
-                            "chat_id": dialog.get("id", ""),
-                            "id": dialog.get("id", ""),
-                            "first_name": dialog.get("first_name", ""),
-                            "last_name": dialog.get("last_name", ""),
-                            "username": username,
-                            "phone": dialog.get("phone", ""),
-                            "is_contact": dialog.get("is_contact", False),
-                            "last_message_date": dialog.get("last_message_date", ""),
-                            "unread_count": dialog.get("unread_count", 0),
-                            "matched_nick": username.lower(),
-                        }
-                        matched.append(dialog_info)
-                        print(f"✅ Найден чат: @{username}")
+                if self._last_chats is not None:
+                    by_user = self._index_by_username(self._last_chats)
+                else:
+                    with open(dialogs_json, "rb") as f:
+                        by_user = self._index_by_username(iter_records(f))
+
+                for nick in sorted(nicknames_set & by_user.keys()):
+                    dialog = by_user[nick]
+                    dialog_info = {
+                        "source": "chats",
+                        "found_in_chat": "Личные сообщения",
+                        "chat_id": dialog.get("id", ""),
+                        "id": dialog.get("id", ""),
+                        "first_name": dialog.get("first_name", ""),
+                        "last_name": dialog.get("last_name", ""),
+                        "username": dialog["username"],
+                        "phone": dialog.get("phone", ""),
+                        "is_contact": dialog.get("is_contact", False),
+                        "last_message_date": dialog.get("last_message_date", ""),
+                        "unread_count": dialog.get("unread_count", 0),
+                        "matched_nick": nick,
+                        "is_premium": False,
+                        "is_verified": False,
+                    }
+                    yield dialog_info
+                    found += 1
+                print(f"✅ Найдено чатов: {found}")
             else:
                 print(
                     f"⚠️ Файл {os.path.basename(dialogs_json)} не найден, пропускаем сверку чатов"
@@ -350,118 +925,159 @@ class FileManager:
         except Exception as e:
             print(f"❌ Ошибка при сверке чатов: {e}")
 
-        return matched
+    @staticmethod
+    def _index_by_username(records) -> Dict[str, Dict]:
+        """Index records by lowercased username, skipping empty ones."""
+        return {
+            record["username"].lower(): record
+            for record in records
+            if record.get("username")
+        }
+
+    def _check_chat_members(self, nicknames_set: FrozenSet[str]) -> Iterator[Dict]:
+        """Check chat members for nickname matches, yielding match records.
 
-    def _check_chat_members(self, nicknames_set: Set[str]) -> List[Dict]:
-        """Check chat members for nickname matches."""
+        Members are matched while streaming: the same user appears once per
+        chat, so indexing by username would drop matches and hold the whole
+        file in memory.
+        """
         print("👥 Сверка участников чатов...")
-        matched = []
+        found = 0
 
         try:
-            members_json = self.get_session_file_path(CHAT_MEMBERS_JSON_TEMPLATE)
-            if os.path.exists(members_json):
-                with open(members_json, encoding="utf-8") as f:
-                    chat_members = json.load(f)
-
-                for member in chat_members:
-                    username = member.get("username", "")
-                    if username and username.lower() in nicknames_set:
-                        member_info = {
-                            "source": "chat_members",
-                            "found_in_chat": f"{member.get('chat_title', '')} ({member.get('chat_type', '')})",
-                            "chat_id": member.get("chat_id", ""),
-                            "id": member.get("user_id", ""),
-                            "first_name": member.get("first_name", ""),
-                            "last_name": member.get("last_name", ""),
-                            "username": username,
-                            "phone": member.get("phone", ""),
-                            "is_bot": member.get("is_bot", False),
-                            "is_premium": member.get("is_premium", False),
-                            "is_verified": member.get("is_verified", False),
-                            "matched_nick": username.lower(),
-                        }
-                        matched.append(member_info)
-                        print(
-                            f"✅ Найден участник в {member.get('chat_title', '')}: @{username}"
+            members_json = self._find_members_file()
+            if members_json:
+                # One shared label string per chat
+                chat_labels = {}
+                for nick, row in self._iter_member_matches(members_json, nicknames_set):
+                    (
+                        chat_id,
+                        chat_title,
+                        chat_type,
+                        user_id,
+                        first_name,
+                        last_name,
+                        username,
+                        phone,
+                        is_bot,
+                        is_premium,
+                        is_verified,
+                    ) = row
+                    found_in_chat = chat_labels.get(chat_id)
+                    if found_in_chat is None:
+                        found_in_chat = chat_labels[chat_id] = (
+                            f"{chat_title} ({chat_type})"
                         )
+                    yield {
+                        "source": "chat_members",
+                        "found_in_chat": found_in_chat,
+                        "chat_id": chat_id,
+                        "id": user_id,
+                        "first_name": first_name,
+                        "last_name": last_name,
+                        "username": username,
+                        "phone": phone,
+                        "is_bot": is_bot,
+                        "is_premium": is_premium,
+                        "is_verified": is_verified,
+                        "matched_nick": nick,
+                        "is_contact": False,
+                        "last_message_date": "",
+                        "unread_count": 0,
+                    }
+                    found += 1
+                print(f"✅ Найдено участников чатов: {found}")
             else:
                 print(
-                    f"⚠️ Файл {os.path.basename(members_json)} не найден, пропускаем сверку участников чатов"
+                    f"⚠️ Файл {os.path.basename(self._members_json_paths()[0])} не найден, пропускаем сверку участников чатов"
                 )
         except Exception as e:
             print(f"❌ Ошибка при сверке участников чатов: {e}")
 
-        return matched
+    def _iter_member_matches(self, members_json: str, nicknames_set: FrozenSet[str]):
+        """Yield (nick, member row) for chat members matching a nickname.
+
+        Rows come from memory right after an export or are streamed from the
+        JSON file; either way they are tuples ordered as CHAT_MEMBER_FIELDS.
+        """
+        # Map each nickname to itself so every match shares the nickname
+        # set's string object; bind hot-loop lookups to locals
+        lookup = {nick: nick for nick in nicknames_set}.get
+        lower = str.lower
+        # First characters of all nicknames in either case: most usernames
+        # are rejected by this probe before any lowercasing or hashing
+        first_chars = frozenset(
+            char
+            for nick in nicknames_set
+            if nick
+            for char in (nick[0], nick[0].upper())
+        )
+
+        if self._last_members is not None:
+            for row in self._last_members:
+                username = row[_MEMBER_USERNAME]
+                if not username or username[0] not in first_chars:
+                    continue
+                # Usernames that are already lowercase need no copy
+                nick = lookup(username)
+                if nick is None and not username.islower():
+                    nick = lookup(lower(username))
+                if nick is not None:
+                    yield nick, row
+            return
+
+        with _open_members_file(members_json, "rb") as f:
+            for member in iter_records(f):
+                username = member.get("username")
+                if not username or username[0] not in first_chars:
+                    continue
+                nick = lookup(username)
+                if nick is None and not username.islower():
+                    nick = lookup(lower(username))
+                if nick is None:
+                    continue
+                try:
+                    yield nick, _member_row(member)
+                except KeyError:
+                    # Files from older versions may miss some fields
+                    yield (
+                        nick,
+                        tuple(
+                            member.get(name, default)
+                            for name, default in _MEMBER_DEFAULTS
+                        ),
+                    )
 
-    def _save_matches(self, matched_contacts: List[Dict]):
-        """Save matched contacts to session-specific files."""
-        print(f"\n🎯 Найдено совпадений: {len(matched_contacts)}")
+    def _save_matches(self, matches: Iterable[Dict]) -> Dict[str, int]:
+        """Stream match records into session-specific files.
+
+        Files are only created when there is at least one match. Returns the
+        number of matches per source.
+        """
+        counts = dict.fromkeys(("contacts", "chats", "chat_members"), 0)
+        matches = iter(matches)
+        first = next(matches, None)
+        if first is None:
+            return counts
 
         matched_csv = self.get_session_file_path(NICKNAMES_MATCHES_CSV_TEMPLATE)
         matched_json = self.get_session_file_path(NICKNAMES_MATCHES_JSON_TEMPLATE)
 
-        with open(matched_csv, "w", newline="", encoding="utf-8") as csvfile:
-            fieldnames = [
-                "source",
-                "found_in_chat",
-                "chat_id",
-                "id",
-                "first_name",
-                "last_name",
-                "username",
-                "phone",
-                "is_bot",
-                "is_contact",
-                "is_premium",
-                "is_verified",
-                "last_message_date",
-                "unread_count",
-                "matched_nick",
-            ]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-
-            for contact in matched_contacts:
-                # Add missing fields for different sources
-                if contact["source"] == "contacts":
-                    contact.update(
-                        {
-                            "last_message_date": "",
-                            "unread_count": 0,
-                            "is_premium": False,
-                            "is_verified": False,
-                            "is_contact": True,
-                        }
-                    )
-                elif contact["source"] == "chats":
-                    contact.update({"is_premium": False, "is_verified": False})
-                elif contact["source"] == "chat_members":
-                    contact.update(
-                        {
-                            "is_contact": False,
-                            "last_message_date": "",
-                            "unread_count": 0,
-                        }
-                    )
-                writer.writerow(contact)
-
-        with open(matched_json, "w", encoding="utf-8") as f:
-            json.dump(matched_contacts, f, ensure_ascii=False, indent=2)
+        with _RecordsWriter(matched_csv, matched_json, MATCH_FIELDS) as writer:
+            for record in chain((first,), matches):
+                counts[record["source"]] += 1
+                writer.write_many((record,))
 
+        print(f"\n🎯 Найдено совпадений: {sum(counts.values())}")
         print(
             f"📁 Совпадения сохранены в {os.path.basename(matched_csv)} и {os.path.basename(matched_json)}"
         )
+        return counts
 
-    def _print_statistics(self, matched_contacts: List[Dict]):
-        """Print statistics about matches."""
-        contacts_count = sum(1 for c in matched_contacts if c["source"] == "contacts")
-        chats_count = sum(1 for c in matched_contacts if c["source"] == "chats")
-        chat_members_count = sum(
-            1 for c in matched_contacts if c["source"] == "chat_members"
-        )
-
+    def _print_statistics(self, counts: Dict[str, int]):
+        """Print statistics about matches per source."""
         print("📊 Статистика:")
-        print(f"  📞 Контакты: {contacts_count}")
-        print(f"  💬 Чаты: {chats_count}")
-        print(f"  👥 Участники чатов: {chat_members_count}")
-        print(f"  🎯 Всего: {len(matched_contacts)}")
+        print(f"  📞 Контакты: {counts['contacts']}")
+        print(f"  💬 Чаты: {counts['chats']}")
+        print(f"  👥 Участники чатов: {counts['chat_members']}")
+        print(f"  🎯 Всего: {sum(counts.values())}")
@@ -0,0 +1,121 @@
+"""JSON serialization and file writing helpers.
+
+Uses orjson when it is installed and falls back to the stdlib json module
+otherwise. Both paths work with bytes, so files are opened in binary mode.
+"""
+
+import json
+import os
+from datetime import date, datetime
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - depends on environment
+    ijson = None
+else:
+    try:
+        ijson = ijson.get_backend("yajl2_c")
+    except ImportError:  # pragma: no cover - C backend not built
+        pass
+
+# orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+JSONDecodeError = json.JSONDecodeError
+
+
+def _default(obj):
+    """Serialize types stdlib json does not support natively."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj, indent: bool = False) -> bytes:
+    """Serialize object to UTF-8 encoded JSON bytes.
+
+    datetime values are written as ISO 8601 strings.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2, default=_default).encode(
+            "utf-8"
+        )
+    # Compact like orjson
+    return json.dumps(
+        obj, ensure_ascii=False, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+
+def loads(data):
+    """Deserialize JSON from bytes or str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def write_atomic(
+    path: str, data: bytes, mode: int = 0o644, fsync: bool = False
+) -> os.stat_result:
+    """Write data to path through a temporary file swapped into place.
+
+    An interrupted write never leaves a truncated file behind. The data
+    goes out in unbuffered writes; mode sets the permissions of a newly
+    created file and fsync flushes it to disk before the swap. Returns the
+    stat of the written file.
+    """
+    tmp_path = path + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        view = memoryview(data)
+        while view:
+            # os.write may write less than asked
+            view = view[os.write(fd, view) :]
+        if fsync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
+    return os.stat(path)
+
+
+def iter_array(f):
+    """Iterate over items of a top-level JSON array in a binary file.
+
+    Streams records one at a time with ijson when it is installed,
+    otherwise loads the whole array.
+    """
+    if ijson is not None:
+        return ijson.items(f, "item", use_float=True)
+    return iter(loads(f.read()))
+
+
+def iter_records(f):
+    """Iterate over records of a JSON Lines or JSON array binary file.
+
+    The format is detected from the first non-empty line; the file must be
+    seekable.
+    """
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(b"["):
+            f.seek(0)
+            yield from iter_array(f)
+            return
+        yield loads(line)
+        break
+
+    for line in f:
+        line = line.strip()
+        if line:
+            yield loads(line)
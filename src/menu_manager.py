@@ -1,10 +1,75 @@
 """Menu management for Telegram exporter."""
 
+import sys
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from session_manager import SessionManager
 
+# Human-readable names of export types used in prompts
+EXPORT_LABELS = {
+    "contacts": "контактов",
+    "chats": "чатов",
+    "chat_members": "участников чатов",
+}
+
+_RULE = "=" * 50
+
+# Static menu blocks, composed once and appended verbatim to the output
+_MAIN_MENU_HEADER = f"\n{_RULE}\n🚀 Telegram Data Exporter\n{_RULE}"
+_MAIN_MENU_NO_SESSION = "\n".join(
+    ["\n📋 Выберите действие:", "1. Управление сессиями", "0. Выход"]
+)
+_MAIN_MENU_WITH_SESSION = "\n".join(
+    [
+        "\n📋 Выберите действие:",
+        "1. Управление сессиями",
+        "2. Экспорт контактов",
+        "3. Экспорт чатов",
+        "4. Экспорт участников чатов",
+        "5. Экспорт всего (контакты + чаты + участники)",
+        "6. Сверка с файлом nicknames.txt",
+        "0. Выход",
+    ]
+)
+_SESSION_MENU_HEADER = f"\n{_RULE}\n📱 Управление сессиями\n{_RULE}"
+_SESSION_MENU_ACTIONS = "\n".join(
+    [
+        "\n📋 Действия:",
+        "1-N. Выбрать сессию (номер из списка)",
+        "N. Создать новую сессию",
+        "D. Удалить сессию",
+        "0. Назад в главное меню",
+    ]
+)
+_SESSION_MENU_ACTIONS_EMPTY = "\n".join(
+    ["\n📋 Действия:", "N. Создать новую сессию", "0. Назад в главное меню"]
+)
+_NEW_SESSION_HEADER = "\n".join(
+    [
+        "\n🔧 Создание новой сессии",
+        "Получите api_id и api_hash на https://my.telegram.org",
+        _RULE,
+        "\n📝 Введите учетные данные:",
+    ]
+)
+
+
+def _print_lines(lines: List[str]):
+    """Print lines with a single write, same output as one print per line."""
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+
+def _prompt(message: str) -> str:
+    """Show prompt and read a line from stdin, like input() without readline."""
+    sys.stdout.write(message)
+    sys.stdout.flush()
+    line = sys.stdin.readline()
+    if not line:
+        raise EOFError
+    return line.rstrip("\n")
+
 
 class MenuManager:
     """Handles menu display and user interaction."""
@@ -13,106 +78,105 @@ class MenuManager:
         self.file_manager = file_manager
         self.session_manager = SessionManager()
         self.current_session = None
+        # Stored progress timestamp -> formatted label, reused across redraws
+        self._timestamp_labels: Dict[str, str] = {}
 
     def show_main_menu(self) -> str:
         """Display main menu and get user choice."""
-        print("\n" + "=" * 50)
-        print("🚀 Telegram Data Exporter")
-        print("=" * 50)
+        lines = [_MAIN_MENU_HEADER]
 
         # Show current session status
         if self.current_session:
             session_info = self.session_manager.get_session_info(self.current_session)
             phone = session_info.get("phone", "Unknown")
-            print(f"\n📱 Текущая сессия: {self.current_session} ({phone})")
+            lines.append(f"\n📱 Текущая сессия: {self.current_session} ({phone})")
         else:
-            print("\n❌ Сессия не выбрана")
+            lines.append("\n❌ Сессия не выбрана")
 
-        self._show_progress_info()
+        lines.extend(self._progress_info_lines())
 
-        print("\n📋 Выберите действие:")
-        if not self.current_session:
-            print("1. Управление сессиями")
-            print("0. Выход")
+        if self.current_session:
+            lines.append(_MAIN_MENU_WITH_SESSION)
         else:
-            print("1. Управление сессиями")
-            print("2. Экспорт контактов")
-            print("3. Экспорт чатов")
-            print("4. Экспорт участников чатов")
-            print("5. Экспорт всего (контакты + чаты + участники)")
-            print("6. Сверка с файлом nicknames.txt")
-            print("0. Выход")
+            lines.append(_MAIN_MENU_NO_SESSION)
+        _print_lines(lines)
 
-        return input("\nВведите номер действия: ").strip()
+        return _prompt("\nВведите номер действия: ").strip()
 
     def show_session_menu(self) -> str:
         """Display session management menu."""
-        print("\n" + "=" * 50)
-        print("📱 Управление сессиями")
-        print("=" * 50)
+        lines = [_SESSION_MENU_HEADER]
 
         sessions = self.session_manager.list_sessions()
 
         if sessions:
-            print("\n📋 Доступные сессии:")
+            lines.append("\n📋 Доступные сессии:")
             for i, session in enumerate(sessions, 1):
                 status = "🟢" if session["name"] == self.current_session else "⚪"
-                last_used = session.get("last_used", "Never")
-                if last_used != "Never" and last_used != "Unknown":
-                    try:
-                        dt = datetime.fromisoformat(last_used.replace("Z", "+00:00"))
-                        last_used = dt.strftime("%d.%m.%Y %H:%M")
-                    except (ValueError, TypeError):
-                        pass
-
-                print(
-                    f"  {i}. {status} {session['name']} ({session['phone']}) - {last_used}"
+                lines.append(
+                    f"  {i}. {status} {session['name']} ({session['phone']}) - "
+                    f"{session['display_last_used']}"
                 )
         else:
-            print("\n❌ Сессии не найдены")
+            lines.append("\n❌ Сессии не найдены")
 
-        print("\n📋 Действия:")
         if sessions:
-            print("1-N. Выбрать сессию (номер из списка)")
-        print("N. Создать новую сессию")
-        if sessions:
-            print("D. Удалить сессию")
-        print("0. Назад в главное меню")
+            lines.append(_SESSION_MENU_ACTIONS)
+        else:
+            lines.append(_SESSION_MENU_ACTIONS_EMPTY)
+        _print_lines(lines)
 
-        return input("\nВведите действие: ").strip().lower()
+        return _prompt("\nВведите действие: ").strip().lower()
 
-    def _show_progress_info(self):
-        """Show information about previous exports."""
+    def _progress_info_lines(self) -> List[str]:
+        """Get lines with information about previous exports."""
+        lines = []
         progress = self.file_manager.progress
         if progress:
-            print("\n📊 Информация о предыдущих экспортах:")
+            lines.append("\n📊 Информация о предыдущих экспортах:")
             for export_type, data in progress.items():
-                timestamp = datetime.fromisoformat(data["timestamp"]).strftime(
-                    "%d.%m.%Y %H:%M"
-                )
+                timestamp = self._format_timestamp(data["timestamp"])
                 status = "✅ Завершен" if data.get("finished") else "⏸️ Прерван"
                 completed = data.get("completed", 0)
                 total = data.get("total", 0)
-                progress_percent = int(completed / total * 100) if total > 0 else 0
+                progress_percent = completed * 100 // total if total > 0 else 0
 
-                print(
+                lines.append(
                     f"  {export_type.capitalize()}: {status} {timestamp} "
                     f"({completed}/{total}, {progress_percent}%)"
                 )
+        return lines
+
+    def _format_timestamp(self, timestamp: str) -> str:
+        """Format stored progress timestamp for display, caching the result."""
+        label = self._timestamp_labels.get(timestamp)
+        if label is None:
+            # Stored in UTC (older files: local time), shown in local time
+            label = (
+                datetime.fromisoformat(timestamp)
+                .astimezone()
+                .strftime("%d.%m.%Y %H:%M")
+            )
+            self._timestamp_labels[timestamp] = label
+        return label
 
     def ask_resume(self, export_type: str) -> bool:
-        """Ask user if they want to resume incomplete export."""
+        """Ask user if they want to resume incomplete export.
+
+        export_type is the progress key: contacts, chats or chat_members.
+        """
         progress = self.file_manager.progress
         if export_type in progress and not progress[export_type].get("finished", False):
-            resume_choice = input(
-                f"Найден незавершенный экспорт {export_type}. Продолжить? (y/n): "
+            label = EXPORT_LABELS.get(export_type, export_type)
+            resume_choice = _prompt(
+                f"Найден незавершенный экспорт {label}. Продолжить? (y/n): "
             ).lower()
             return resume_choice in ["y", "yes", "да", "д"]
         return False
 
     def wait_for_continue(self):
         """Wait for user to press Enter to continue."""
-        input("\nНажмите Enter для продолжения...")
+        _prompt("\nНажмите Enter для продолжения...")
 
     def handle_session_management(self) -> bool:
         """Handle session management menu. Returns True if session was selected."""
@@ -152,14 +216,10 @@ class MenuManager:
 
     def create_new_session(self) -> Optional[str]:
         """Create a new session interactively."""
-        print("\n🔧 Создание новой сессии")
-        print("Получите api_id и api_hash на https://my.telegram.org")
-        print("=" * 50)
-
-        print("\n📝 Введите учетные данные:")
-        api_id = input("API ID: ").strip()
-        api_hash = input("API Hash: ").strip()
-        phone = input(
+        _print_lines([_NEW_SESSION_HEADER])
+        api_id = _prompt("API ID: ").strip()
+        api_hash = _prompt("API Hash: ").strip()
+        phone = _prompt(
             "Номер телефона (с кодом страны, например +79991234567): "
         ).strip()
 
@@ -173,7 +233,7 @@ class MenuManager:
         # Check if session already exists
         if self.session_manager.session_exists(session_name):
             print(f"⚠️ Сессия для номера {phone} уже существует!")
-            overwrite = input("Перезаписать? (y/n): ").lower()
+            overwrite = _prompt("Перезаписать? (y/n): ").lower()
             if overwrite not in ["y", "yes", "да", "д"]:
                 return None
 
@@ -193,14 +253,13 @@ class MenuManager:
             print("❌ Нет сессий для удаления")
             return
 
-        print("\n🗑️ Удаление сессии")
-        print("Выберите сессию для удаления:")
-
+        lines = ["\n🗑️ Удаление сессии", "Выберите сессию для удаления:"]
         for i, session in enumerate(sessions, 1):
-            print(f"  {i}. {session['name']} ({session['phone']})")
+            lines.append(f"  {i}. {session['name']} ({session['phone']})")
+        _print_lines(lines)
 
         try:
-            choice = input("\nНомер сессии для удаления (0 - отмена): ").strip()
+            choice = _prompt("\nНомер сессии для удаления (0 - отмена): ").strip()
             if choice == "0":
                 return
 
@@ -208,7 +267,7 @@ class MenuManager:
             if 0 <= session_num < len(sessions):
                 session_to_delete = sessions[session_num]["name"]
 
-                confirm = input(
+                confirm = _prompt(
                     f"Удалить сессию '{session_to_delete}'? (y/n): "
                 ).lower()
                 if confirm in ["y", "yes", "да", "д"]:
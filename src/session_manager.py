@@ -1,9 +1,25 @@
 """Session management for Telegram exporter."""
 
-import json
 import os
+import re
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+
+from json_utils import JSONDecodeError, dumps, loads, write_atomic
+
+# Characters stripped from phone numbers in session names
+_NON_ALNUM_RE = re.compile(r"[\W_]+")
+
+
+def _display_time(value: str) -> str:
+    """Format stored ISO timestamp for menus, leaving placeholders as is."""
+    if value in ("Never", "Unknown"):
+        return value
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (ValueError, TypeError, AttributeError):
+        return value
+    return dt.strftime("%d.%m.%Y %H:%M")
 
 
 class SessionManager:
@@ -11,6 +27,12 @@ class SessionManager:
 
     def __init__(self):
         self.sessions_dir = "sessions"
+        # Session name -> ((mtime_ns, size) of info file, parsed info)
+        self._info_cache: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+        # (sessions dir mtime_ns, sorted sessions) from the last listing
+        self._listing_cache: Tuple[int, List[Dict]] = (-1, [])
+        # Legacy session files are checked only once
+        self._migration_done = False
         self.ensure_sessions_dir()
 
     def ensure_sessions_dir(self):
@@ -27,16 +49,41 @@ class SessionManager:
         return os.path.join(self.sessions_dir, f"{session_name}_info.json")
 
     def list_sessions(self) -> List[Dict]:
-        """List all available sessions with their metadata."""
+        """List all available sessions with their metadata.
+
+        The sorted listing is reused until the sessions directory changes or
+        session metadata is written through this manager.
+        """
         sessions = []
 
-        if not os.path.exists(self.sessions_dir):
+        try:
+            dir_mtime = os.stat(self.sessions_dir).st_mtime_ns
+        except FileNotFoundError:
             return sessions
+        if self._listing_cache[0] == dir_mtime:
+            return list(self._listing_cache[1])
 
-        for file in os.listdir(self.sessions_dir):
-            if file.endswith(".session"):
-                session_name = file[:-8]  # Remove .session extension
-                session_info = self.get_session_info(session_name)
+        # One directory scan finds both session and info files, so sessions
+        # without an info file need no extra stat
+        try:
+            with os.scandir(self.sessions_dir) as it:
+                entries = list(it)
+        except FileNotFoundError:
+            return sessions
+        info_entries = {
+            entry.name: entry for entry in entries if entry.name.endswith("_info.json")
+        }
+
+        for entry in entries:
+            if entry.name.endswith(".session"):
+                session_name = entry.name[:-8]  # Remove .session extension
+                info_entry = info_entries.get(f"{session_name}_info.json")
+                try:
+                    info_stat = info_entry.stat() if info_entry else None
+                except FileNotFoundError:
+                    info_stat = None
+                session_info = self._get_session_info_cached(session_name, info_stat)
+                last_used = session_info.get("last_used", "Never")
 
                 sessions.append(
                     {
@@ -44,50 +91,88 @@ class SessionManager:
                         "phone": session_info.get("phone", "Unknown"),
                         "api_id": session_info.get("api_id", "Unknown"),
                         "created": session_info.get("created", "Unknown"),
-                        "last_used": session_info.get("last_used", "Never"),
+                        "last_used": last_used,
+                        # Formatted once and cached with the listing
+                        "display_last_used": _display_time(last_used),
                         "exists": True,
                     }
                 )
 
-        return sorted(sessions, key=lambda x: x.get("last_used", ""), reverse=True)
+        sessions.sort(key=lambda x: x.get("last_used", ""), reverse=True)
+        self._listing_cache = (dir_mtime, sessions)
+        return list(sessions)
+
+    def _invalidate_listing(self):
+        """Drop cached sessions listing."""
+        self._listing_cache = (-1, [])
 
     def get_session_info(self, session_name: str) -> Dict:
-        """Get session metadata."""
-        info_path = self.get_session_info_path(session_name)
+        """Get session metadata.
+
+        Parsed metadata is cached and reused until the info file changes.
+        """
+        try:
+            st = os.stat(self.get_session_info_path(session_name))
+        except FileNotFoundError:
+            st = None
+        return self._get_session_info_cached(session_name, st)
+
+    def _get_session_info_cached(
+        self, session_name: str, st: Optional[os.stat_result]
+    ) -> Dict:
+        """Get session metadata given the info file stat (None if missing)."""
+        if st is None:
+            self._info_cache.pop(session_name, None)
+            return {}
+
+        stat_key = (st.st_mtime_ns, st.st_size)
+        cached = self._info_cache.get(session_name)
+        if cached is not None and cached[0] == stat_key:
+            return cached[1]
 
-        if os.path.exists(info_path):
-            try:
-                with open(info_path, encoding="utf-8") as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                pass
+        try:
+            with open(self.get_session_info_path(session_name), "rb") as f:
+                info = loads(f.read())
+        except (JSONDecodeError, FileNotFoundError):
+            return {}
+
+        self._info_cache[session_name] = (stat_key, info)
+        return info
 
-        return {}
+    def _write_session_info(self, session_name: str, info: Dict):
+        """Write session metadata atomically and keep it cached."""
+        info_path = self.get_session_info_path(session_name)
+        # Swap in a complete, synced file so a crash never leaves broken
+        # credentials; readable only by the owner
+        st = write_atomic(info_path, dumps(info), mode=0o600, fsync=True)
+        self._info_cache[session_name] = ((st.st_mtime_ns, st.st_size), info)
+        self._invalidate_listing()
 
     def save_session_info(
         self, session_name: str, api_id: str, api_hash: str, phone: str
     ):
         """Save session metadata."""
+        now_iso = datetime.now().isoformat()
         info = {
             "api_id": api_id,
             "api_hash": api_hash,
             "phone": phone,
-            "created": datetime.now().isoformat(),
-            "last_used": datetime.now().isoformat(),
+            "created": now_iso,
+            "last_used": now_iso,
         }
 
-        info_path = self.get_session_info_path(session_name)
-        with open(info_path, "w", encoding="utf-8") as f:
-            json.dump(info, f, ensure_ascii=False, indent=2)
+        self._write_session_info(session_name, info)
 
-    def update_last_used(self, session_name: str):
-        """Update last used timestamp for session."""
-        info = self.get_session_info(session_name)
-        info["last_used"] = datetime.now().isoformat()
+    def update_last_used(self, session_name: str, now_iso: Optional[str] = None):
+        """Update last used timestamp for session.
 
-        info_path = self.get_session_info_path(session_name)
-        with open(info_path, "w", encoding="utf-8") as f:
-            json.dump(info, f, ensure_ascii=False, indent=2)
+        Cached metadata is updated in place, so only the write touches disk
+        besides a stat. Pass now_iso to reuse one timestamp across several
+        sessions.
+        """
+        info = self.get_session_info(session_name)
+        info["last_used"] = now_iso or datetime.now().isoformat()
+        self._write_session_info(session_name, info)
 
     def session_exists(self, session_name: str) -> bool:
         """Check if session exists."""
@@ -105,6 +190,8 @@ class SessionManager:
             if os.path.exists(info_path):
                 os.remove(info_path)
 
+            self._info_cache.pop(session_name, None)
+            self._invalidate_listing()
             return True
         except Exception as e:
             print(f"❌ Ошибка при удалении сессии: {e}")
@@ -124,11 +211,18 @@ class SessionManager:
     def create_session_name(self, phone: str) -> str:
         """Generate session name from phone number."""
         # Remove + and other non-alphanumeric characters
-        clean_phone = "".join(c for c in phone if c.isalnum())
+        clean_phone = _NON_ALNUM_RE.sub("", phone)
         return f"session_{clean_phone}"
 
     def migrate_old_session(self):
-        """Migrate old anon.session to new sessions structure."""
+        """Migrate old anon.session to new sessions structure.
+
+        Only the first call looks for legacy files; later calls return None.
+        """
+        if self._migration_done:
+            return None
+        self._migration_done = True
+
         from config import LEGACY_CREDENTIALS_FILE, LEGACY_SESSION_FILE
 
         old_session = LEGACY_SESSION_FILE
@@ -141,8 +235,8 @@ class SessionManager:
             credentials = {}
             if os.path.exists(old_credentials):
                 try:
-                    with open(old_credentials, encoding="utf-8") as f:
-                        credentials = json.load(f)
+                    with open(old_credentials, "rb") as f:
+                        credentials = loads(f.read())
                 except Exception:
                     pass
 
@@ -153,6 +247,7 @@ class SessionManager:
             # Move session file
             new_session_path = self.get_session_path(session_name)
             os.rename(old_session, new_session_path)
+            self._invalidate_listing()
 
             # Save session info
             if credentials:
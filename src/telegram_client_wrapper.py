@@ -1,18 +1,114 @@
 """Telegram client wrapper for handling Telegram API operations."""
 
+import asyncio
 import os
+import sys
+import time
 from getpass import getpass
-from typing import Dict, List
+from operator import attrgetter
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Tuple
 
 from telethon import TelegramClient
 from telethon.errors import (
     ChannelPrivateError,
     ChatAdminRequiredError,
+    FloodWaitError,
     SessionPasswordNeededError,
 )
 from telethon.tl.functions.channels import GetParticipantsRequest
 from telethon.tl.functions.contacts import GetContactsRequest
-from telethon.tl.types import Channel, ChannelParticipantsSearch, Chat
+from telethon.tl.types import ChannelParticipantsSearch
+
+from config import (
+    CHAT_MEMBERS_CONCURRENCY,
+    CHAT_MEMBERS_WRITE_BATCH,
+    DIALOGS_CACHE_TTL,
+    FLOOD_WAIT_RETRIES,
+    MAX_CONCURRENT_REQUESTS,
+    PARTICIPANTS_PAGE_SIZE,
+    PARTICIPANTS_PAGES_CONCURRENCY,
+)
+
+# Entity attributes read when building export rows
+_ENTITY_FIELDS = (
+    "first_name",
+    "last_name",
+    "username",
+    "phone",
+    "contact",
+    "bot",
+    "premium",
+    "verified",
+)
+
+# Member attributes in chat member row order, resolved in a single C call
+_member_attrs = attrgetter(
+    "id",
+    "first_name",
+    "last_name",
+    "username",
+    "phone",
+    "bot",
+    "premium",
+    "verified",
+)
+
+
+def _entity_fields(entity) -> Dict:
+    """Get entity attributes as a dict.
+
+    Telethon TL objects store all fields in the instance __dict__, which is
+    cheaper to query than a getattr() with default for every field.
+    """
+    try:
+        return vars(entity)
+    except TypeError:
+        return {name: getattr(entity, name, None) for name in _ENTITY_FIELDS}
+
+
+def _page_members(page) -> List:
+    """Get the users listed as participants in a GetParticipantsRequest page.
+
+    page.users also holds users the participants only reference (inviters,
+    admins who promoted them) and is deduplicated, so members are looked up
+    by participant instead, in participant order.
+    """
+    users_by_id = {user.id: user for user in page.users}
+    return [
+        users_by_id[participant.user_id]
+        for participant in page.participants
+        if participant.user_id in users_by_id
+    ]
+
+
+def _user_chat_row(dialog) -> Dict:
+    """Build export row for a private chat dialog."""
+    entity = dialog.entity
+    fields = _entity_fields(entity)
+    return {
+        "id": entity.id,
+        "first_name": fields.get("first_name") or "",
+        "last_name": fields.get("last_name") or "",
+        "username": fields.get("username") or "",
+        "phone": fields.get("phone") or "",
+        "is_contact": fields.get("contact", False),
+        # Serialized to ISO 8601 by the file writers
+        "last_message_date": dialog.date or "",
+        "unread_count": dialog.unread_count,
+    }
+
+
+def _group_chat_row(dialog) -> Dict:
+    """Build chat info for a group or channel dialog."""
+    entity = dialog.entity
+    return {
+        "chat_id": entity.id,
+        "chat_title": dialog.title or "Без названия",
+        "chat_type": "channel" if dialog.is_channel else "group",
+        "is_channel": dialog.is_channel,
+        "entity": entity,
+        "dialog": dialog,
+    }
 
 
 class TelegramClientWrapper:
@@ -24,6 +120,24 @@ class TelegramClientWrapper:
         self.api_hash = None
         self.phone = None
         self.session_file = None
+        self._dialogs_cache = None
+        self._dialogs_ts = 0.0
+        # (session file, api_id, api_hash) -> started client
+        self._clients: Dict[Tuple[str, str, str], TelegramClient] = {}
+        # Created lazily inside the running event loop
+        self._dialogs_lock = None
+        self._client_lock = None
+        self._request_semaphore = None
+
+    def _request_slot(self) -> asyncio.Semaphore:
+        """Get the semaphore shared by all Telegram requests.
+
+        Exports run concurrently and each fans out further, so this keeps
+        the total number of requests in flight bounded.
+        """
+        if self._request_semaphore is None:
+            self._request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        return self._request_semaphore
 
     def set_credentials(self, api_id: str, api_hash: str, phone: str):
         """Set API credentials."""
@@ -35,32 +149,50 @@ class TelegramClientWrapper:
         """Set session file path."""
         self.session_file = session_file
 
-    async def create_client(self):
-        """Create and authenticate Telegram client."""
+    async def create_client(self) -> bool:
+        """Create and authenticate Telegram client.
+
+        A still connected client started earlier for the same session file
+        and credentials is reused. Returns True if a new client was started.
+        """
         if not self.session_file:
             raise ValueError("Session file not set")
 
-        if os.path.exists(self.session_file):
-            print("Найден файл сессии, используем существующую сессию")
+        if self._client_lock is None:
+            self._client_lock = asyncio.Lock()
 
-        self.client = TelegramClient(self.session_file, self.api_id, self.api_hash)
+        async with self._client_lock:
+            key = (self.session_file, self.api_id, self.api_hash)
+            cached = self._clients.get(key)
+            if cached is not None and cached.is_connected():
+                if cached is not self.client:
+                    self.client = cached
+                    self._invalidate_dialogs()
+                return False
 
-        try:
-            await self.client.start(phone=self.phone)
-        except SessionPasswordNeededError:
-            password = getpass("Введите пароль двухфакторной аутентификации: ")
-            await self.client.start(phone=self.phone, password=password)
+            if os.path.exists(self.session_file):
+                print("Найден файл сессии, используем существующую сессию")
 
-        print("Успешно подключен к Telegram!")
+            self.client = TelegramClient(self.session_file, self.api_id, self.api_hash)
+            self._invalidate_dialogs()
+
+            try:
+                await self.client.start(phone=self.phone)
+            except SessionPasswordNeededError:
+                password = getpass("Введите пароль двухфакторной аутентификации: ")
+                await self.client.start(phone=self.phone, password=password)
+
+            self._clients[key] = self.client
+            print("Успешно подключен к Telegram!")
+            return True
 
     async def get_contacts(self) -> List[Dict]:
         """Get all Telegram contacts."""
-        contacts_result = await self.client(GetContactsRequest(hash=0))
-        contacts = contacts_result.users
+        async with self._request_slot():
+            contacts_result = await self.client(GetContactsRequest(hash=0))
 
-        contact_list = []
-        for contact in contacts:
-            contact_info = {
+        return [
+            {
                 "id": contact.id,
                 "first_name": contact.first_name or "",
                 "last_name": contact.last_name or "",
@@ -69,54 +201,132 @@ class TelegramClientWrapper:
                 "is_bot": contact.bot,
                 "is_contact": True,
             }
-            contact_list.append(contact_info)
-
-        return contact_list
+            for contact in contacts_result.users
+        ]
 
     async def get_chats(self) -> List[Dict]:
         """Get all user chats/dialogs."""
-        dialogs = await self.client.get_dialogs()
-        user_dialogs = [d for d in dialogs if d.is_user]
-
-        dialog_list = []
-        for dialog in user_dialogs:
-            entity = dialog.entity
-            dialog_info = {
-                "id": entity.id,
-                "first_name": getattr(entity, "first_name", "") or "",
-                "last_name": getattr(entity, "last_name", "") or "",
-                "username": getattr(entity, "username", "") or "",
-                "phone": getattr(entity, "phone", "") or "",
-                "is_contact": getattr(entity, "contact", False),
-                "last_message_date": dialog.date.isoformat() if dialog.date else "",
-                "unread_count": dialog.unread_count,
-            }
-            dialog_list.append(dialog_info)
-
-        return dialog_list
+        user_chats, _ = await self.get_user_and_group_chats()
+        return list(user_chats)
 
     async def get_all_group_chats(self) -> List[Dict]:
         """Get list of all group chats and channels."""
-        dialogs = await self.client.get_dialogs()
-        group_dialogs = [d for d in dialogs if d.is_group or d.is_channel]
-
-        chat_list = []
-        for dialog in group_dialogs:
-            entity = dialog.entity
-            chat_info = {
-                "chat_id": entity.id,
-                "chat_title": dialog.title or "Без названия",
-                "chat_type": "channel" if dialog.is_channel else "group",
-                "is_channel": dialog.is_channel,
-                "entity": entity,
-                "dialog": dialog,
-            }
-            chat_list.append(chat_info)
+        _, group_chats = await self.get_user_and_group_chats()
+        return list(group_chats)
+
+    async def get_user_and_group_chats(
+        self, max_age: float = DIALOGS_CACHE_TTL
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """Get user chats and group chats/channels from one dialogs pass.
+
+        Dialogs are streamed once and split by type; the result is reused
+        for max_age seconds, and concurrent callers wait for a single fetch
+        instead of each requesting the dialogs.
+        """
+        if self._dialogs_lock is None:
+            self._dialogs_lock = asyncio.Lock()
+
+        async with self._dialogs_lock:
+            if (
+                self._dialogs_cache is not None
+                and time.monotonic() - self._dialogs_ts < max_age
+            ):
+                return self._dialogs_cache
+
+            user_chats = []
+            group_chats = []
+            try:
+                async with self._request_slot():
+                    async for dialog in self.client.iter_dialogs():
+                        if dialog.is_user:
+                            user_chats.append(_user_chat_row(dialog))
+                        elif dialog.is_group or dialog.is_channel:
+                            group_chats.append(_group_chat_row(dialog))
+            except Exception:
+                self._invalidate_dialogs()
+                raise
+
+            self._dialogs_cache = (user_chats, group_chats)
+            self._dialogs_ts = time.monotonic()
+            return self._dialogs_cache
+
+    def _invalidate_dialogs(self):
+        """Drop cached dialogs lists."""
+        self._dialogs_cache = None
+        self._dialogs_ts = 0.0
+
+    async def get_all_members(
+        self,
+        chat_list: List[Dict],
+        on_members: Callable[[Dict, List[Tuple], bool, bool], Awaitable],
+        concurrency: int = CHAT_MEMBERS_CONCURRENCY,
+        batch_size: int = CHAT_MEMBERS_WRITE_BATCH,
+    ):
+        """Get members of several chats concurrently.
+
+        At most concurrency chats are fetched at a time. Rows are passed to
+        on_members(chat_info, rows, done, failed) in batches of up to
+        batch_size as they are built, so a large chat is never held in full;
+        the last call for a chat has done=True and may have no rows. A chat
+        that fails mid-fetch ends with the rows it produced and failed=True,
+        and no failure stops the other chats. A chat's next batch is fetched
+        while the previous one is handled; its calls still run one at a time
+        and in order.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_chat(chat_info: Dict):
+            batch = []
+            pending = None
+            failed = False
+            async with semaphore:
+                try:
+                    async for row in self.iter_chat_members(chat_info):
+                        batch.append(row)
+                        if len(batch) >= batch_size:
+                            if pending is not None:
+                                # Clear first so a failed write is not
+                                # awaited again below
+                                previous, pending = pending, None
+                                await previous
+                            pending = asyncio.ensure_future(
+                                on_members(chat_info, batch, False, False)
+                            )
+                            batch = []
+                except Exception as e:
+                    print(f"❌ Ошибка при получении участников: {e}")
+                    failed = True
+            if pending is not None:
+                await pending
+            await on_members(chat_info, batch, True, failed)
+
+        results = await asyncio.gather(
+            *(fetch_chat(chat_info) for chat_info in chat_list),
+            return_exceptions=True,
+        )
+        for chat_info, result in zip(chat_list, results):
+            if isinstance(result, Exception):
+                print(
+                    f"❌ Ошибка при обработке чата {chat_info['chat_title']}: {result}"
+                )
+
+    async def get_chat_members_for_chat(self, chat_info: Dict) -> List[Tuple]:
+        """Get members from a specific chat.
 
-        return chat_list
+        Rows are tuples ordered as CHAT_MEMBER_FIELDS, which keeps large
+        member lists much smaller than dicts.
+        """
+        return [row async for row in self.iter_chat_members(chat_info)]
 
-    async def get_chat_members_for_chat(self, chat_info: Dict) -> List[Dict]:
-        """Get members from a specific chat."""
+    async def iter_chat_members(self, chat_info: Dict) -> AsyncIterator[Tuple]:
+        """Iterate over members of a specific chat as CHAT_MEMBER_FIELDS rows.
+
+        Rows are yielded one at a time, so callers can write them in batches
+        instead of building the whole chat's list; members are also fetched
+        lazily, a few channel pages at a time. A chat whose members are not
+        accessible is reported and yields nothing more; other errors are
+        raised.
+        """
         chat_id = chat_info["chat_id"]
         chat_title = chat_info["chat_title"]
         chat_type = chat_info["chat_type"]
@@ -125,51 +335,150 @@ class TelegramClientWrapper:
 
         print(f"\n🔍 Обрабатываем {chat_type}: {chat_title}")
 
-        members_list = []
+        # Paged results may repeat users if membership changes
+        # mid-scan, so emit each user once per chat
+        seen_ids = set()
+
+        try:
+            async for member in self._iter_participants(entity, dialog):
+                try:
+                    (
+                        user_id,
+                        first_name,
+                        last_name,
+                        username,
+                        phone,
+                        bot,
+                        premium,
+                        verified,
+                    ) = _member_attrs(member)
+                except AttributeError:
+                    # Not a full User object, read what it has
+                    try:
+                        user_id = member.id
+                    except AttributeError:
+                        continue
+                    fields = _entity_fields(member)
+                    first_name = fields.get("first_name")
+                    last_name = fields.get("last_name")
+                    username = fields.get("username")
+                    phone = fields.get("phone")
+                    bot = fields.get("bot", False)
+                    premium = fields.get("premium", False)
+                    verified = fields.get("verified", False)
+
+                if user_id in seen_ids:
+                    continue
+                seen_ids.add(user_id)
+                yield (
+                    chat_id,
+                    chat_title,
+                    chat_type,
+                    user_id,
+                    first_name or "",
+                    last_name or "",
+                    username or "",
+                    phone or "",
+                    bot,
+                    premium,
+                    verified,
+                )
+
+            print(f"✅ Найдено {len(seen_ids)} участников")
+
+        except (ChatAdminRequiredError, ChannelPrivateError) as e:
+            print(f"⚠️ Нет доступа к участникам: {e}")
+
+    async def _iter_participants(self, entity, dialog) -> AsyncIterator:
+        """Iterate over chat participants as they are fetched."""
+        if dialog.is_channel:
+            async for user in self._get_channel_participants(entity):
+                yield user
+        else:
+            # Basic groups are small, so fetch them whole and yield once
+            # the request slot is released rather than hold it while the
+            # consumer handles each user
+            users = await self._request_with_flood_retry(
+                lambda: self.client.get_participants(entity)
+            )
+            for user in users:
+                yield user
+
+    async def _get_channel_participants(self, entity) -> AsyncIterator:
+        """Iterate over channel participants page by page.
+
+        The first page reports the participant count, so the next pages are
+        requested PARTICIPANTS_PAGES_CONCURRENCY at a time and yielded before
+        the following ones are requested; the scan then continues past the
+        end until an empty page in case members joined meanwhile.
+        """
+        first_page = await self._get_participants_page(entity, 0)
+        if not first_page.participants:
+            return
+        for user in _page_members(first_page):
+            yield user
+
+        offset = len(first_page.participants)
+        offsets = range(offset, first_page.count, PARTICIPANTS_PAGE_SIZE)
+        for start in range(0, len(offsets), PARTICIPANTS_PAGES_CONCURRENCY):
+            window = offsets[start : start + PARTICIPANTS_PAGES_CONCURRENCY]
+            pages = await asyncio.gather(
+                *(self._get_participants_page(entity, o) for o in window)
+            )
+            for page in pages:
+                for user in _page_members(page):
+                    yield user
+            offset = window[-1] + len(pages[-1].participants)
+
+        while True:
+            page = await self._get_participants_page(entity, offset)
+            if not page.participants:
+                break
+            for user in _page_members(page):
+                yield user
+            offset += len(page.participants)
+
+    async def _get_participants_page(self, entity, offset: int):
+        """Request one page of channel participants, waiting out flood limits."""
+        return await self._request_with_flood_retry(
+            lambda: self.client(
+                GetParticipantsRequest(
+                    entity,
+                    ChannelParticipantsSearch(""),
+                    offset=offset,
+                    limit=PARTICIPANTS_PAGE_SIZE,
+                    hash=0,
+                )
+            )
+        )
+
+    async def _request_with_flood_retry(self, make_request: Callable[[], Awaitable]):
+        """Run a request in a request slot, retrying after FloodWait.
 
-        if isinstance(entity, (Channel, Chat)):
+        make_request is called again for every attempt. The flood limit is
+        waited out outside the slot, and the wait is reported on stderr so
+        it does not break the progress line on stdout.
+        """
+        for attempt in range(FLOOD_WAIT_RETRIES + 1):
             try:
-                if dialog.is_channel:
-                    participants = await self.client(
-                        GetParticipantsRequest(
-                            entity,
-                            ChannelParticipantsSearch(""),
-                            offset=0,
-                            limit=10000,
-                            hash=0,
-                        )
-                    )
-                    members = participants.users
-                else:
-                    members = await self.client.get_participants(entity)
-
-                for member in members:
-                    if hasattr(member, "id"):
-                        member_info = {
-                            "chat_id": chat_id,
-                            "chat_title": chat_title,
-                            "chat_type": chat_type,
-                            "user_id": member.id,
-                            "first_name": getattr(member, "first_name", "") or "",
-                            "last_name": getattr(member, "last_name", "") or "",
-                            "username": getattr(member, "username", "") or "",
-                            "phone": getattr(member, "phone", "") or "",
-                            "is_bot": getattr(member, "bot", False),
-                            "is_premium": getattr(member, "premium", False),
-                            "is_verified": getattr(member, "verified", False),
-                        }
-                        members_list.append(member_info)
-
-                print(f"✅ Найдено {len(members)} участников")
-
-            except (ChatAdminRequiredError, ChannelPrivateError) as e:
-                print(f"⚠️ Нет доступа к участникам: {e}")
-            except Exception as e:
-                print(f"❌ Ошибка при получении участников: {e}")
-
-        return members_list
+                async with self._request_slot():
+                    return await make_request()
+            except FloodWaitError as e:
+                if attempt == FLOOD_WAIT_RETRIES:
+                    raise
+                print(
+                    f"⏳ Ограничение Telegram, ожидание {e.seconds} сек...",
+                    file=sys.stderr,
+                )
+                # Retrying right at the reported time can still hit the limit
+                await asyncio.sleep(e.seconds + 1)
 
     async def disconnect(self):
-        """Disconnect from Telegram."""
+        """Disconnect all started clients from Telegram."""
+        self._invalidate_dialogs()
+        clients = set(self._clients.values())
         if self.client:
-            await self.client.disconnect()
+            clients.add(self.client)
+        self._clients.clear()
+        for client in clients:
+            await client.disconnect()
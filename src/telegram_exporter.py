@@ -4,10 +4,70 @@ Telegram contacts and chats exporter.
 This module provides the main orchestrator for exporting Telegram data.
 """
 
+import asyncio
+import functools
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+
+from config import (
+    CHAT_MEMBER_FIELDS,
+    CHAT_MEMBERS_CSV_TEMPLATE,
+    CHAT_MEMBERS_JSON_TEMPLATE,
+    CHAT_MEMBERS_JSONL_TEMPLATE,
+    FILE_IO_WORKERS,
+    PROGRESS_BATCH_SIZE,
+)
 from file_manager import FileManager
 from menu_manager import MenuManager
 from telegram_client_wrapper import TelegramClientWrapper
 
+_MEMBER_USER_ID = CHAT_MEMBER_FIELDS.index("user_id")
+
+
+async def _run_in_thread(func, *args, **kwargs):
+    """Run blocking function in a worker thread without stalling the loop.
+
+    Uses the loop's default executor, which TelegramExporter.run() replaces
+    with its file I/O pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+async def _run_prompt(func, *args):
+    """Run blocking menu prompt in a daemon thread without stalling the loop.
+
+    Executor threads are joined on shutdown, so one stuck reading stdin
+    would keep the program from exiting after Ctrl+C; a daemon thread is
+    simply abandoned instead.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def set_result(result, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def worker():
+        try:
+            result, error = func(*args), None
+        except BaseException as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(set_result, result, error)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    threading.Thread(target=worker, daemon=True).start()
+    return await future
+
 
 class TelegramExporter:
     """
@@ -20,86 +80,119 @@ class TelegramExporter:
         self.file_manager = FileManager()
         self.menu_manager = MenuManager(self.file_manager)
         self.telegram_client = TelegramClientWrapper()
+        # Session whose files and credentials the client is set up with
+        self._configured_session = None
+        # A few threads are enough for file I/O, which mostly waits on the disk
+        self._io_pool = ThreadPoolExecutor(
+            max_workers=FILE_IO_WORKERS, thread_name_prefix="export-io"
+        )
+
+        # Menu choice -> (handler, requires Telegram connection)
+        self._handlers = {
+            "1": (self._handle_session_management, False),
+            "2": (self.export_contacts, True),
+            "3": (self.export_chats, True),
+            "4": (self._handle_export_chat_members, True),
+            "5": (self._handle_export_all, True),
+            "6": (self._handle_cross_reference, False),
+        }
 
         # Initialize sessions and migrate if needed
         self.menu_manager.initialize_sessions()
 
-    async def export_contacts(self, resume: bool = False):
+    def _save_with_progress(self, export_type: str, save, records):
+        """Write records with save, reporting progress as they hit the disk.
+
+        Runs in a worker thread. Rows are already built by the client
+        wrapper, so progress tracks the write itself.
+        """
+        total = len(records)
+        # Redraw the progress line about once per percent
+        print_step = max(1, total // 100)
+        last_checkpoint = 0
+        stdout = sys.stdout
+        save_progress = self.file_manager.save_progress
+
+        def on_progress(done: int):
+            nonlocal last_checkpoint
+            progress = done * 100 // total
+            stdout.write(f"\rПрогресс: {done}/{total} ({progress}%)")
+            if done == total:
+                stdout.write("\n")
+            stdout.flush()
+
+            if done - last_checkpoint >= PROGRESS_BATCH_SIZE:
+                save_progress(
+                    export_type, {"completed": done, "total": total, "finished": False}
+                )
+                last_checkpoint = done
+
+        # Records go out a progress step at a time
+        save(records, on_progress, print_step)
+
+    async def export_contacts(self, flush_progress: bool = True):
         """Export Telegram contacts to CSV and JSON files."""
         print("\n📞 Экспорт контактов...")
 
+        # The list is fetched in one request and rewritten in full, so
+        # there is nothing to resume from
         contacts = await self.telegram_client.get_contacts()
         total = len(contacts)
 
-        if resume and "contacts" in self.file_manager.progress:
-            completed = self.file_manager.progress["contacts"].get("completed", 0)
-            print(f"Продолжение с позиции {completed}/{total}")
-            contacts = contacts[completed:]
-        else:
-            completed = 0
-
-        contact_list = []
-        for i, contact in enumerate(contacts, completed):
-            contact_list.append(contact)
-
-            progress = int((i + 1) / total * 100)
-            print(f"\rПрогресс: {i + 1}/{total} ({progress}%)", end="", flush=True)
-
-            if (i + 1) % 10 == 0:
-                self.file_manager.save_progress(
-                    "contacts", {"completed": i + 1, "total": total, "finished": False}
-                )
-
-        print(f"\n✅ Контакты обработаны: {total}")
+        await _run_in_thread(
+            self._save_with_progress,
+            "contacts",
+            self.file_manager.save_contacts_to_files,
+            contacts,
+        )
+        print(f"✅ Контакты обработаны: {total}")
 
-        self.file_manager.save_contacts_to_files(contact_list)
-        self.file_manager.save_progress(
-            "contacts", {"completed": total, "total": total, "finished": True}
+        await _run_in_thread(
+            self.file_manager.save_progress,
+            "contacts",
+            {"completed": total, "total": total, "finished": True},
+            defer_finished=not flush_progress,
         )
 
         return total
 
-    async def export_chats(self, resume: bool = False):
+    async def export_chats(self, flush_progress: bool = True):
         """Export Telegram chats to CSV and JSON files."""
         print("\n💬 Экспорт чатов...")
 
+        # The list is fetched in one request and rewritten in full, so
+        # there is nothing to resume from
         chats = await self.telegram_client.get_chats()
         total = len(chats)
 
-        if resume and "chats" in self.file_manager.progress:
-            completed = self.file_manager.progress["chats"].get("completed", 0)
-            print(f"Продолжение с позиции {completed}/{total}")
-            chats = chats[completed:]
-        else:
-            completed = 0
-
-        chat_list = []
-        for i, chat in enumerate(chats, completed):
-            chat_list.append(chat)
-
-            progress = int((i + 1) / total * 100)
-            print(f"\rПрогресс: {i + 1}/{total} ({progress}%)", end="", flush=True)
-
-            if (i + 1) % 10 == 0:
-                self.file_manager.save_progress(
-                    "chats", {"completed": i + 1, "total": total, "finished": False}
-                )
-
-        print(f"\n✅ Чаты обработаны: {total}")
+        await _run_in_thread(
+            self._save_with_progress,
+            "chats",
+            self.file_manager.save_chats_to_files,
+            chats,
+        )
+        print(f"✅ Чаты обработаны: {total}")
 
-        self.file_manager.save_chats_to_files(chat_list)
-        self.file_manager.save_progress(
-            "chats", {"completed": total, "total": total, "finished": True}
+        await _run_in_thread(
+            self.file_manager.save_progress,
+            "chats",
+            {"completed": total, "total": total, "finished": True},
+            defer_finished=not flush_progress,
         )
 
         return total
 
-    async def export_chat_members(self, resume: bool = False):
+    async def export_chat_members(
+        self, resume: bool = False, flush_progress: bool = True
+    ):
         """Export all members from all accessible chats and groups."""
         print("\n👥 Экспорт участников чатов...")
 
-        # Get list of all chats
-        all_chats = await self.telegram_client.get_all_group_chats()
+        # Get list of all chats, reading saved progress meanwhile
+        all_chats, saved_progress = await asyncio.gather(
+            self.telegram_client.get_all_group_chats(),
+            _run_in_thread(self.file_manager.load_progress),
+        )
         total_chats = len(all_chats)
 
         if total_chats == 0:
@@ -107,93 +200,144 @@ class TelegramExporter:
             return 0
 
         # Check what was already processed
-        processed_chat_ids = []
-        completed_chats = 0
+        processed_chat_ids = set()
         total_members = 0
 
-        if resume and "chat_members" in self.file_manager.progress:
-            progress_data = self.file_manager.progress["chat_members"]
-            processed_chat_ids = progress_data.get("processed_items", [])
-            completed_chats = progress_data.get("completed", 0)
-            print(f"Продолжение с позиции {completed_chats}/{total_chats} чатов")
+        if resume and "chat_members" in saved_progress:
+            processed_chat_ids = await _run_in_thread(
+                self.file_manager.load_processed_chat_ids
+            )
         else:
             # Clear existing files if not resuming
             if not resume:
-                import os
-
-                from config import (
+                for template in [
                     CHAT_MEMBERS_CSV_TEMPLATE,
                     CHAT_MEMBERS_JSON_TEMPLATE,
-                )
-
-                for template in [CHAT_MEMBERS_CSV_TEMPLATE, CHAT_MEMBERS_JSON_TEMPLATE]:
+                    CHAT_MEMBERS_JSONL_TEMPLATE,
+                ]:
                     file_path = self.file_manager.get_session_file_path(template)
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
+                    for path in (file_path, file_path + ".gz"):
+                        with suppress(FileNotFoundError):
+                            os.unlink(path)
+                await _run_in_thread(self.file_manager.reset_processed_chats)
 
         print(f"📊 Всего чатов для обработки: {total_chats}")
 
-        # Process each chat individually
-        for i, chat_info in enumerate(all_chats):
-            chat_id = chat_info["chat_id"]
+        # Skip already processed chats
+        pending_chats = [
+            chat_info
+            for chat_info in all_chats
+            if chat_info["chat_id"] not in processed_chat_ids
+        ]
+        # The log may list chats the account has since left, so count
+        # only the current chats it covers
+        completed_chats = total_chats - len(pending_chats)
+        if processed_chat_ids:
+            print(f"Продолжение с позиции {completed_chats}/{total_chats} чатов")
+
+        # Chats cut off by an interruption may already have rows on disk
+        written_ids = {}
+        if resume:
+            written_ids = await _run_in_thread(
+                self.file_manager.written_member_ids,
+                [chat_info["chat_id"] for chat_info in pending_chats],
+            )
 
-            # Skip if already processed
-            if chat_id in processed_chat_ids:
-                continue
+        # Member files stay open for the whole export
+        await _run_in_thread(self.file_manager.open_chat_members_stream, resume)
+
+        # Writes run in worker threads, so keep them in order
+        save_lock = asyncio.Lock()
+        chat_print_step = max(1, total_chats // 100)
+        # Chats cut short by an error are left for a resumed export
+        failed_chat_ids = set()
+
+        async def process_chat(chat_info, chat_members, done, failed):
+            """Save a batch of fetched members of a single chat."""
+            nonlocal completed_chats, total_members
+            chat_id = chat_info["chat_id"]
 
             try:
-                # Get members for this specific chat
-                chat_members = await self.telegram_client.get_chat_members_for_chat(
-                    chat_info
-                )
+                skip_ids = written_ids.get(chat_id)
+                if skip_ids:
+                    chat_members = [
+                        m for m in chat_members if m[_MEMBER_USER_ID] not in skip_ids
+                    ]
 
                 if chat_members:
                     # Save immediately (append mode)
-                    self.file_manager.save_chat_members_to_files(
-                        chat_members,
-                        append=(completed_chats > 0 or len(processed_chat_ids) > 0),
-                    )
+                    async with save_lock:
+                        await _run_in_thread(
+                            self.file_manager.save_chat_members_to_files,
+                            chat_members,
+                        )
                     total_members += len(chat_members)
+            except Exception as e:
+                print(f"❌ Ошибка при обработке чата {chat_info['chat_title']}: {e}")
+                failed = True
+
+            if failed:
+                failed_chat_ids.add(chat_id)
+            if not done:
+                return
+
+            if chat_id in failed_chat_ids:
+                # Not marked processed, so resuming fetches it again and
+                # skips the rows already written
+                print(
+                    f"⚠️ Чат {chat_info['chat_title']} выгружен не полностью, "
+                    "он будет загружен снова при продолжении экспорта"
+                )
+                return
 
-                # Mark this chat as processed
-                processed_chat_ids.append(chat_id)
-                completed_chats += 1
+            # The log is written after the chat's members, so it never
+            # lists a chat whose rows are not on disk
+            async with save_lock:
+                await _run_in_thread(self.file_manager.mark_chat_processed, chat_id)
+            completed_chats += 1
 
-                # Update progress
-                progress = int(completed_chats / total_chats * 100)
+            # Update progress about once per percent
+            if completed_chats % chat_print_step == 0 or completed_chats == total_chats:
+                progress = completed_chats * 100 // total_chats
                 print(f"Прогресс чатов: {completed_chats}/{total_chats} ({progress}%)")
 
-                # Save progress every chat
-                self.file_manager.save_progress(
-                    "chat_members",
-                    {
-                        "completed": completed_chats,
-                        "total": total_chats,
-                        "finished": completed_chats >= total_chats,
-                        "processed_items": processed_chat_ids,
-                    },
-                )
+            # Processed chats are tracked by the log, so the counters can
+            # be saved at the usual throttled rate
+            await _run_in_thread(
+                self.file_manager.save_progress,
+                "chat_members",
+                {
+                    "completed": completed_chats,
+                    "total": total_chats,
+                    "finished": completed_chats >= total_chats,
+                },
+                defer_finished=not flush_progress,
+            )
 
-            except Exception as e:
-                print(f"❌ Ошибка при обработке чата {chat_info['chat_title']}: {e}")
-                # Still mark as processed to avoid infinite retries
-                processed_chat_ids.append(chat_id)
-                completed_chats += 1
-                continue
+        # Process chats concurrently, writing members as they arrive
+        await self.telegram_client.get_all_members(pending_chats, process_chat)
+
+        await _run_in_thread(self.file_manager.finalize_chat_members)
 
         print(
             f"\n✅ Участники чатов обработаны: {total_members} из {total_chats} чатов"
         )
+        if failed_chat_ids:
+            print(
+                f"⚠️ Не выгружено полностью чатов: {len(failed_chat_ids)}, "
+                "продолжите экспорт, чтобы загрузить их"
+            )
 
-        # Final progress save
-        self.file_manager.save_progress(
+        # Final progress save; failed chats keep the export resumable
+        await _run_in_thread(
+            self.file_manager.save_progress,
             "chat_members",
             {
                 "completed": completed_chats,
                 "total": total_chats,
-                "finished": True,
-                "processed_items": processed_chat_ids,
+                "finished": not failed_chat_ids and completed_chats >= total_chats,
             },
+            defer_finished=not flush_progress,
         )
 
         return total_members
@@ -204,107 +348,121 @@ class TelegramExporter:
             print("❌ Сначала необходимо выбрать или создать сессию (пункт 1)")
             return False
 
-        # Set session context for file operations
-        self.file_manager.set_session(self.menu_manager.current_session)
-
-        # Get session credentials
-        credentials = self.menu_manager.get_current_session_credentials()
-        if not credentials:
-            print("❌ Не удалось загрузить учетные данные сессии")
-            return False
-
-        # Set up client
-        session_path = self.menu_manager.get_current_session_path()
-        self.telegram_client.set_session_file(session_path)
-        self.telegram_client.set_credentials(
-            credentials["api_id"], credentials["api_hash"], credentials["phone"]
-        )
+        session_name = self.menu_manager.current_session
+        # Exports of the same session reuse its setup, which also keeps the
+        # file manager's caches for it
+        if session_name != self._configured_session:
+            # Set session context for file operations
+            self.file_manager.set_session(session_name)
+
+            # Get session credentials
+            credentials = self.menu_manager.get_current_session_credentials()
+            if not credentials:
+                print("❌ Не удалось загрузить учетные данные сессии")
+                return False
+
+            # Set up client
+            session_path = self.menu_manager.get_current_session_path()
+            self.telegram_client.set_session_file(session_path)
+            self.telegram_client.set_credentials(
+                credentials["api_id"], credentials["api_hash"], credentials["phone"]
+            )
+            self._configured_session = session_name
 
-        if not self.telegram_client.client:
-            await self.telegram_client.create_client()
+        # Reuses the connected client unless the session changed
+        if await self.telegram_client.create_client():
             # Update last used timestamp
-            self.menu_manager.session_manager.update_last_used(
-                self.menu_manager.current_session
-            )
+            self.menu_manager.session_manager.update_last_used(session_name)
 
         return True
 
+    async def _handle_session_management(self):
+        """Handle session menu and connect to the selected session."""
+        session_selected = await _run_prompt(
+            self.menu_manager.handle_session_management
+        )
+        # Sessions may have been recreated with other credentials
+        self._configured_session = None
+        if session_selected and self.menu_manager.current_session:
+            print("\n🔄 Проверка подключения к Telegram...")
+            if await self.ensure_connection():
+                print("✅ Подключение успешно установлено!")
+            else:
+                print("❌ Не удалось подключиться")
+
+    async def _handle_export_chat_members(self):
+        """Ask about resuming, export chat members and report the result."""
+        resume = await _run_prompt(self.menu_manager.ask_resume, "chat_members")
+        members_count = await self.export_chat_members(resume=resume)
+        print(f"\n🎉 Экспорт участников завершен! Найдено {members_count} участников")
+
+    async def _handle_export_all(self):
+        """Export contacts, chats and chat members."""
+        # Only the member export can pick up where it stopped
+        resume_members = await _run_prompt(self.menu_manager.ask_resume, "chat_members")
+
+        # The exports use different API methods and mostly wait on the
+        # network, so they run concurrently and share one dialogs fetch.
+        # Each runs to completion even if another fails, so none is left
+        # writing files in the background once the menu is back.
+        results = await asyncio.gather(
+            self.export_contacts(flush_progress=False),
+            self.export_chats(flush_progress=False),
+            self.export_chat_members(resume=resume_members, flush_progress=False),
+            return_exceptions=True,
+        )
+        # One progress write covers all three finished exports
+        await _run_in_thread(self.file_manager.flush_progress)
+
+        failed = any(isinstance(result, BaseException) for result in results)
+        if failed:
+            print("\n⚠️ Полный экспорт завершен с ошибками")
+        else:
+            print("\n🎉 Полный экспорт завершен!")
+        labels = ("📞 Контактов", "💬 Чатов", "👥 Участников чатов")
+        for label, result in zip(labels, results):
+            if isinstance(result, BaseException):
+                print(f"{label}: ❌ ошибка: {result}")
+            else:
+                print(f"{label}: {result}")
+
+    async def _handle_cross_reference(self):
+        """Cross-reference exported data with nicknames file."""
+        matches_count = await _run_in_thread(
+            self.file_manager.cross_reference_nicknames
+        )
+        if matches_count > 0:
+            print(f"\n🎉 Сверка завершена! Найдено {matches_count} совпадений")
+        else:
+            print("\n😞 Сверка завершена, совпадений не найдено")
+
     async def run(self):
         """Main application loop."""
+        asyncio.get_running_loop().set_default_executor(self._io_pool)
         try:
             while True:
-                choice = self.menu_manager.show_main_menu()
+                # Menu prompts block on reading stdin, so they run in a thread to
+                # keep the Telegram client serviced meanwhile
+                choice = await _run_prompt(self.menu_manager.show_main_menu)
 
                 if choice == "0":
                     print("👋 До свидания!")
                     break
 
-                if choice == "1":
-                    # Session management
-                    session_selected = self.menu_manager.handle_session_management()
-                    if session_selected and self.menu_manager.current_session:
-                        print("\n🔄 Проверка подключения к Telegram...")
-                        if await self.ensure_connection():
-                            print("✅ Подключение успешно установлено!")
-                        else:
-                            print("❌ Не удалось подключиться")
-
-                elif choice == "2":
-                    if not await self.ensure_connection():
-                        continue
-
-                    resume = self.menu_manager.ask_resume("контактов")
-                    await self.export_contacts(resume=resume)
-
-                elif choice == "3":
-                    if not await self.ensure_connection():
-                        continue
-
-                    resume = self.menu_manager.ask_resume("чатов")
-                    await self.export_chats(resume=resume)
-
-                elif choice == "4":
-                    if not await self.ensure_connection():
-                        continue
-
-                    resume = self.menu_manager.ask_resume("участников чатов")
-                    members_count = await self.export_chat_members(resume=resume)
-                    print(
-                        f"\n🎉 Экспорт участников завершен! Найдено {members_count} участников"
-                    )
-
-                elif choice == "5":
-                    if not await self.ensure_connection():
-                        continue
-
-                    resume_contacts = self.menu_manager.ask_resume("контактов")
-                    resume_chats = self.menu_manager.ask_resume("чатов")
-                    resume_members = self.menu_manager.ask_resume("участников чатов")
-
-                    contacts_count = await self.export_contacts(resume=resume_contacts)
-                    chats_count = await self.export_chats(resume=resume_chats)
-                    members_count = await self.export_chat_members(
-                        resume=resume_members
-                    )
-
-                    print("\n🎉 Полный экспорт завершен!")
-                    print(f"📞 Контактов: {contacts_count}")
-                    print(f"💬 Чатов: {chats_count}")
-                    print(f"👥 Участников чатов: {members_count}")
-
-                elif choice == "6":
-                    matches_count = self.file_manager.cross_reference_nicknames()
-                    if matches_count > 0:
-                        print(
-                            f"\n🎉 Сверка завершена! Найдено {matches_count} совпадений"
-                        )
-                    else:
-                        print("\n😞 Сверка завершена, совпадений не найдено")
-
-                else:
+                entry = self._handlers.get(choice)
+                if entry is None:
                     print("❌ Неверный выбор, попробуйте снова")
+                else:
+                    handler, needs_connection = entry
+                    if needs_connection and not await self.ensure_connection():
+                        continue
+                    await handler()
 
-                self.menu_manager.wait_for_continue()
+                await _run_prompt(self.menu_manager.wait_for_continue)
 
         finally:
+            # Let writes still in flight finish before their files are closed
+            self._io_pool.shutdown(wait=True)
+            self.file_manager.close_member_writers()
+            self.file_manager.flush_progress()
             await self.telegram_client.disconnect()
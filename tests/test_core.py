@@ -1,7 +1,6 @@
 """Основные тесты для Telegram exporter."""
 
-import tempfile
-from contextlib import contextmanager
+import io
 from unittest.mock import MagicMock
 
 import pytest
@@ -11,36 +10,22 @@ from session_manager import SessionManager
 from telegram_exporter import TelegramExporter
 
 
-@contextmanager
-def temp_directory():
-    """Временная директория с автоочисткой."""
-    import shutil
-
-    test_dir = tempfile.mkdtemp()
-    try:
-        yield test_dir
-    finally:
-        shutil.rmtree(test_dir, ignore_errors=True)
-
-
 @pytest.fixture
-def session_manager():
+def session_manager(tmp_path):
     """SessionManager с временной директорией."""
-    with temp_directory() as test_dir:
-        manager = SessionManager()
-        manager.sessions_dir = f"{test_dir}/sessions"
-        manager.ensure_sessions_dir()
-        yield manager
+    manager = SessionManager()
+    manager.sessions_dir = str(tmp_path / "sessions")
+    manager.ensure_sessions_dir()
+    return manager
 
 
 @pytest.fixture
-def file_manager():
+def file_manager(tmp_path):
     """FileManager с временной директорией."""
-    with temp_directory() as test_dir:
-        manager = FileManager()
-        manager.exports_dir = f"{test_dir}/exports"
-        manager.ensure_exports_dir()
-        yield manager
+    manager = FileManager()
+    manager.exports_dir = str(tmp_path / "exports")
+    manager.ensure_exports_dir()
+    return manager
 
 
 def test_session_manager_basic(session_manager):
@@ -65,6 +50,53 @@ def test_session_manager_basic(session_manager):
     assert creds["api_id"] == api_id
 
 
+def test_session_info_cache(session_manager):
+    """Тест кэширования файла метаданных сессии."""
+    import os
+
+    session_name = "session_1"
+    assert session_manager.get_session_info(session_name) == {}
+
+    # Файл, созданный в обход менеджера, виден сразу
+    with open(session_manager.get_session_info_path(session_name), "w") as f:
+        f.write('{"phone": "1"}')
+    assert session_manager.get_session_info(session_name) == {"phone": "1"}
+
+    session_manager.save_session_info(session_name, "1", "hash", "+1")
+    assert session_manager.get_session_info(session_name)["phone"] == "+1"
+    assert os.path.exists(session_manager.get_session_info_path(session_name))
+
+
+def test_list_sessions_cache(session_manager, monkeypatch):
+    """Тест повторного использования и обновления списка сессий."""
+    for name in ("session_1", "session_2"):
+        open(session_manager.get_session_path(name), "w").close()
+        session_manager.save_session_info(name, "1", "hash", name)
+    session_manager.update_last_used("session_1", "2000-01-01T00:00:00")
+    session_manager.update_last_used("session_2", "2000-01-02T00:00:00")
+
+    listing = session_manager.list_sessions()
+    assert [s["name"] for s in listing] == ["session_2", "session_1"]
+    assert listing[0]["display_last_used"] == "02.01.2000 00:00"
+
+    # Пока директория не менялась, список берется из кэша
+    def fail_scandir(path):
+        raise AssertionError("list_sessions rescanned the directory")
+
+    monkeypatch.setattr("session_manager.os.scandir", fail_scandir)
+    assert session_manager.list_sessions() == listing
+    monkeypatch.undo()
+
+    session_manager.update_last_used("session_1", "2000-01-03T00:00:00")
+    assert [s["name"] for s in session_manager.list_sessions()] == [
+        "session_1",
+        "session_2",
+    ]
+
+    session_manager.delete_session("session_2")
+    assert [s["name"] for s in session_manager.list_sessions()] == ["session_1"]
+
+
 def test_file_manager_basic(file_manager):
     """Тест базовой функциональности FileManager."""
     # Установка сессии
@@ -86,34 +118,501 @@ def test_file_manager_basic(file_manager):
     assert loaded_progress["test_export"]["completed"] == 50
 
 
+def test_progress_throttling(file_manager):
+    """Тест отложенной записи прогресса."""
+    file_manager.set_session("test_session")
+    file_manager.save_progress("contacts", {"completed": 10, "total": 100})
+    file_manager.save_progress("contacts", {"completed": 200, "total": 1000})
+
+    # Вторая запись пока только в памяти
+    assert file_manager.load_progress()["contacts"]["completed"] == 200
+    reader = FileManager()
+    reader.exports_dir = file_manager.exports_dir
+    reader.set_session("test_session")
+    assert reader.load_progress()["contacts"]["completed"] == 10
+
+    file_manager.flush_progress()
+    assert reader.load_progress()["contacts"]["completed"] == 200
+
+    # Контрольная точка с flush=True пишется сразу
+    file_manager.save_progress("chat_members", {"completed": 1, "total": 5}, flush=True)
+    assert reader.load_progress()["chat_members"]["completed"] == 1
+
+    # Отложенное завершение ждет flush_progress
+    file_manager.save_progress(
+        "chats",
+        {"completed": 5, "total": 5, "finished": True},
+        defer_finished=True,
+    )
+    assert "chats" not in reader.load_progress()
+    file_manager.flush_progress()
+    assert reader.load_progress()["chats"]["finished"] is True
+
+
+def test_processed_chats_log(file_manager):
+    """Тест журнала обработанных чатов."""
+    file_manager.set_session("test_session")
+    assert file_manager.load_processed_chat_ids() == set()
+
+    for chat_id in (10, 20, 10):
+        file_manager.mark_chat_processed(chat_id)
+    assert file_manager.load_processed_chat_ids() == {10, 20}
+
+    file_manager.reset_processed_chats()
+    assert file_manager.load_processed_chat_ids() == set()
+
+    # Список processed_items старого формата переносится в журнал
+    import file_manager as file_manager_module
+
+    progress_file = file_manager.get_session_file_path(
+        file_manager_module.PROGRESS_FILE_TEMPLATE
+    )
+    with open(progress_file, "w", encoding="utf-8") as f:
+        f.write('{"chat_members": {"completed": 2, "processed_items": [1, 2]}}')
+    file_manager.mark_chat_processed(3)
+    assert file_manager.load_processed_chat_ids() == {1, 2, 3}
+    file_manager.save_progress("chat_members", {"completed": 3}, flush=True)
+
+    reader = FileManager()
+    reader.exports_dir = file_manager.exports_dir
+    reader.set_session("test_session")
+    assert reader.load_processed_chat_ids() == {1, 2, 3}
+
+
+@pytest.mark.parametrize("json_lines", [True, False])
+def test_records_writer_output(tmp_path, monkeypatch, json_lines):
+    """Тест совместимости записи CSV с csv.DictWriter и JSON с dumps."""
+    import csv
+
+    import file_manager as file_manager_module
+    from json_utils import dumps
+
+    monkeypatch.setattr(file_manager_module, "JSON_LINES_OUTPUT", json_lines)
+    fieldnames = ["id", "name", "note"]
+    rows = [
+        {"id": 1, "name": "Иван, Петров", "note": 'он сказал "привет"'},
+        {"id": 2, "name": "многострочное\nимя", "note": None},
+        {"id": 3, "name": "", "note": True},
+        {"id": 4},
+    ]
+
+    manual_csv = tmp_path / "manual.csv"
+    manual_json = tmp_path / "manual.json"
+    stdlib_csv = tmp_path / "stdlib.csv"
+    with file_manager_module._RecordsWriter(
+        str(manual_csv), str(manual_json), fieldnames
+    ) as writer:
+        writer.write_many(rows[:1])
+        writer.write_many(rows[1:])
+    with open(stdlib_csv, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    assert manual_csv.read_bytes() == stdlib_csv.read_bytes()
+    if json_lines:
+        expected = b"".join(dumps(row) + b"\n" for row in rows)
+    else:
+        expected = dumps(rows, indent=True)
+    assert manual_json.read_bytes() == expected
+
+
+def test_chat_members_csv_matches_csv_writer(file_manager, tmp_path):
+    """Тест совместимости CSV участников с csv.writer."""
+    import csv
+
+    import file_manager as file_manager_module
+
+    rows = [
+        (1, 'Чат "один"', "group", 5, "Иван,", "", "ivan", "+7", True, False, False),
+        (1, 'Чат "один"', "group", 6, "много\nстрок", "", "", "", False, True, False),
+    ]
+    file_manager.set_session("test_session")
+    file_manager.save_chat_members_to_files(rows)
+    file_manager.close_member_writers()
+
+    stdlib_csv = tmp_path / "stdlib.csv"
+    with open(stdlib_csv, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(file_manager_module.CHAT_MEMBER_FIELDS)
+        writer.writerows(rows)
+    members_csv = file_manager.get_session_file_path(
+        file_manager_module.CHAT_MEMBERS_CSV_TEMPLATE
+    )
+    with open(members_csv, "rb") as f:
+        assert f.read() == stdlib_csv.read_bytes()
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_iter_records_formats(tmp_path, monkeypatch, streaming):
+    """Тест чтения JSON Lines и JSON-массива."""
+    import json_utils
+    from json_utils import dumps, iter_records
+
+    if not streaming:
+        monkeypatch.setattr(json_utils, "ijson", None)
+
+    records = [{"id": 1, "username": "тест"}, {"id": 2, "username": ""}]
+
+    jsonl_file = tmp_path / "records.jsonl"
+    jsonl_file.write_bytes(b"".join(dumps(r) + b"\n" for r in records) + b"\n")
+    array_file = tmp_path / "records.json"
+    array_file.write_bytes(b"\n" + dumps(records, indent=True))
+    empty_file = tmp_path / "empty.json"
+    empty_file.write_bytes(b"")
+
+    for path in (jsonl_file, array_file):
+        with open(path, "rb") as f:
+            assert list(iter_records(f)) == records
+    with open(empty_file, "rb") as f:
+        assert list(iter_records(f)) == []
+
+
+def test_json_stdlib_fallback(monkeypatch):
+    """Тест сериализации JSON без orjson."""
+    from datetime import datetime
+
+    import json_utils
+
+    data = {"name": "тест", "date": datetime(2024, 1, 2, 3, 4, 5), "items": [1, 2]}
+    expected = json_utils.dumps(data, indent=True)
+
+    monkeypatch.setattr(json_utils, "orjson", None)
+    assert json_utils.dumps(data, indent=True) == expected
+    assert json_utils.loads(json_utils.dumps(data))["date"] == "2024-01-02T03:04:05"
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_cross_reference_nicknames(file_manager, tmp_path, monkeypatch, compress):
+    """Тест сверки с файлом никнеймов."""
+    import file_manager as file_manager_module
+
+    monkeypatch.setattr(file_manager_module, "COMPRESS_CHAT_MEMBERS", compress)
+
+    nicknames_file = tmp_path / "nicknames.txt"
+    nicknames_file.write_text("Alice\n\nbob\n", encoding="utf-8")
+    monkeypatch.setattr(file_manager_module, "NICKNAMES_FILE", str(nicknames_file))
+
+    file_manager.set_session("test_session")
+    file_manager.save_contacts_to_files(
+        [
+            {"id": 1, "first_name": "Alice", "username": "alice"},
+            {"id": 2, "first_name": "Carol", "username": "carol"},
+        ]
+    )
+    file_manager.save_chat_members_to_files(
+        [
+            (10, "Group", "group", 3, "Bob", "", "Bob", "", False, False, False),
+            (10, "Group", "group", 4, "", "", "", "", False, False, False),
+        ]
+    )
+    assert file_manager.cross_reference_nicknames() == 2
+    matches_csv = file_manager.get_session_file_path(
+        file_manager_module.NICKNAMES_MATCHES_CSV_TEMPLATE
+    )
+    with open(matches_csv, encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 3
+
+    # Повторная сверка читает те же данные из файлов: до финализации
+    # участники берутся из файла JSON Lines
+    file_manager.set_session("test_session")
+    assert file_manager.cross_reference_nicknames() == 2
+
+    file_manager.finalize_chat_members()
+    assert file_manager.cross_reference_nicknames() == 2
+
+
+def test_ask_resume_uses_progress_key(file_manager, monkeypatch, capsys):
+    """Тест предложения продолжить незавершенный экспорт."""
+    from menu_manager import MenuManager
+
+    file_manager.set_session("test_session")
+    file_manager.save_progress("contacts", {"completed": 5, "total": 10})
+
+    monkeypatch.setattr("sys.stdin", io.StringIO("y\n"))
+    menu = MenuManager(file_manager)
+
+    assert menu.ask_resume("contacts") is True
+    assert "контактов" in capsys.readouterr().out
+    assert menu.ask_resume("chats") is False
+
+
 @pytest.mark.integration
-def test_exporter_initialization():
+def test_exporter_initialization(tmp_path):
     """Тест инициализации основного экспортера."""
-    with temp_directory() as test_dir:
-        exporter = TelegramExporter()
-        exporter.file_manager.exports_dir = f"{test_dir}/exports"
-        exporter.menu_manager.session_manager.sessions_dir = f"{test_dir}/sessions"
+    exporter = TelegramExporter()
+    exporter.file_manager.exports_dir = str(tmp_path / "exports")
+    exporter.menu_manager.session_manager.sessions_dir = str(tmp_path / "sessions")
 
-        # Проверка компонентов
-        assert exporter.file_manager is not None
-        assert exporter.menu_manager is not None
-        assert exporter.telegram_client is not None
+    # Проверка компонентов
+    assert exporter.file_manager is not None
+    assert exporter.menu_manager is not None
+    assert exporter.telegram_client is not None
 
 
 @pytest.mark.integration
-async def test_export_workflow():
+async def test_export_workflow(tmp_path):
     """Тест workflow экспорта."""
     from unittest.mock import AsyncMock
 
-    with temp_directory() as test_dir:
-        exporter = TelegramExporter()
-        exporter.file_manager.exports_dir = f"{test_dir}/exports"
-        exporter.file_manager.set_session("test_session")
+    exporter = TelegramExporter()
+    exporter.file_manager.exports_dir = str(tmp_path / "exports")
+    exporter.file_manager.set_session("test_session")
+
+    # Мок данных
+    mock_contacts = [{"id": 123, "first_name": "Test", "username": "test"}]
+    exporter.telegram_client.get_contacts = AsyncMock(return_value=mock_contacts)
+
+    # Экспорт
+    result = await exporter.export_contacts()
+    assert result == 1
+
+
+def _exported_member_keys(file_manager):
+    """Пары (chat_id, user_id) из файла участников в порядке записи."""
+    from file_manager import _open_members_file
+    from json_utils import iter_records
+
+    with _open_members_file(file_manager._find_members_file(), "rb") as f:
+        return [(r["chat_id"], r["user_id"]) for r in iter_records(f)]
+
+
+def _member_exporter(tmp_path, chat_ids, iter_chat_members):
+    """TelegramExporter с замоканными чатами и участниками."""
+    from unittest.mock import AsyncMock
+
+    exporter = TelegramExporter()
+    exporter.file_manager.exports_dir = str(tmp_path / "exports")
+    exporter.file_manager.set_session("test_session")
+    chats = [
+        {
+            "chat_id": chat_id,
+            "chat_title": f"Чат {chat_id}",
+            "chat_type": "group",
+            "entity": None,
+            "dialog": None,
+        }
+        for chat_id in chat_ids
+    ]
+    exporter.telegram_client.get_all_group_chats = AsyncMock(return_value=chats)
+    exporter.telegram_client.iter_chat_members = iter_chat_members
+    return exporter
+
+
+def _member_row(chat_id, user_id):
+    """Строка участника в порядке CHAT_MEMBER_FIELDS."""
+    title = f"Чат {chat_id}"
+    username = f"u{user_id}"
+    return (chat_id, title, "group", user_id, "", "", username, "", False, False, False)
+
+
+@pytest.mark.integration
+async def test_chat_members_failed_chat_is_resumed(tmp_path):
+    """Тест повторной загрузки чата, прерванного ошибкой."""
+    failing = {2}
+
+    async def iter_chat_members(chat_info):
+        chat_id = chat_info["chat_id"]
+        for user_id in range(3):
+            if chat_id in failing and user_id == 1:
+                raise ConnectionError("сеть недоступна")
+            yield _member_row(chat_id, user_id)
+
+    exporter = _member_exporter(tmp_path, (1, 2), iter_chat_members)
+    file_manager = exporter.file_manager
+
+    assert await exporter.export_chat_members() == 4
+    # Чат с ошибкой не отмечен обработанным, экспорт можно продолжить
+    assert file_manager.load_processed_chat_ids() == {1}
+    assert file_manager.load_progress()["chat_members"]["finished"] is False
+
+    failing.clear()
+    assert await exporter.export_chat_members(resume=True) == 2
+    assert file_manager.load_processed_chat_ids() == {1, 2}
+    assert file_manager.load_progress()["chat_members"]["finished"] is True
+    keys = _exported_member_keys(file_manager)
+    assert sorted(keys) == [(c, u) for c in (1, 2) for u in range(3)]
+
+
+@pytest.mark.integration
+async def test_chat_members_resume_ignores_left_chats(tmp_path):
+    """Тест подсчета прогресса без чатов, которых уже нет в списке."""
+    failing = {2, 3}
+
+    async def iter_chat_members(chat_info):
+        if chat_info["chat_id"] in failing:
+            raise ConnectionError("сеть недоступна")
+        yield _member_row(chat_info["chat_id"], 0)
+
+    exporter = _member_exporter(tmp_path, (1, 2, 3), iter_chat_members)
+    file_manager = exporter.file_manager
+    await exporter.export_chat_members()
+    # Чаты, из которых аккаунт вышел, остаются в журнале
+    file_manager.mark_chat_processed(98)
+    file_manager.mark_chat_processed(99)
+
+    failing.discard(2)
+    await exporter.export_chat_members(resume=True)
+    progress = file_manager.load_progress()["chat_members"]
+    assert (progress["completed"], progress["total"]) == (2, 3)
+    assert progress["finished"] is False
+
+
+@pytest.mark.integration
+async def test_chat_members_resume_after_interrupted_batch(tmp_path):
+    """Тест продолжения экспорта, прерванного посреди чата."""
+    import functools
+
+    class Killed(BaseException):
+        pass
+
+    killed = {1}
+
+    async def iter_chat_members(chat_info):
+        chat_id = chat_info["chat_id"]
+        for user_id in range(5):
+            if chat_id in killed and user_id == 4:
+                # Первый пакет записан, второй мог не дойти до диска
+                raise Killed()
+            yield _member_row(chat_id, user_id)
+
+    exporter = _member_exporter(tmp_path, (1, 2), iter_chat_members)
+    client = exporter.telegram_client
+    client.get_all_members = functools.partial(client.get_all_members, batch_size=2)
+    file_manager = exporter.file_manager
+
+    await exporter.export_chat_members()
+    assert 1 not in file_manager.load_processed_chat_ids()
+    assert (1, 0) in _exported_member_keys(file_manager)
+
+    killed.clear()
+    await exporter.export_chat_members(resume=True)
+    assert file_manager.load_processed_chat_ids() == {1, 2}
+    keys = _exported_member_keys(file_manager)
+    assert sorted(keys) == [(c, u) for c in (1, 2) for u in range(5)]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_resume_from_truncated_members(file_manager, monkeypatch, compress):
+    """Тест продолжения после обрыва записи файла участников."""
+    import os
+
+    import file_manager as file_manager_module
+
+    monkeypatch.setattr(file_manager_module, "COMPRESS_CHAT_MEMBERS", compress)
+    file_manager.set_session("test_session")
+    file_manager.open_chat_members_stream()
+    file_manager.save_chat_members_to_files([_member_row(1, u) for u in range(3)])
+    file_manager.save_chat_members_to_files([_member_row(2, u) for u in range(3)])
+    file_manager.close_member_writers()
+
+    # Процесс убит посреди записи последнего пакета
+    members_path = file_manager._find_members_file()
+    assert members_path.endswith(".jsonl.gz" if compress else ".jsonl")
+    os.truncate(members_path, os.path.getsize(members_path) - 6)
+
+    resumed = FileManager()
+    resumed.exports_dir = file_manager.exports_dir
+    resumed.set_session("test_session")
+    written = resumed.written_member_ids([1, 2])
+    assert written[1] == {0, 1, 2}
+
+    resumed.open_chat_members_stream(append=True)
+    resumed.save_chat_members_to_files(
+        [_member_row(2, u) for u in range(3) if u not in written.get(2, ())]
+    )
+    resumed.finalize_chat_members()
+    keys = _exported_member_keys(resumed)
+    assert sorted(keys) == [(c, u) for c in (1, 2) for u in range(3)]
+
+
+async def test_channel_members_streamed_by_page_window(monkeypatch):
+    """Тест записи участников канала до запроса последней страницы."""
+    from types import SimpleNamespace
+
+    import telegram_client_wrapper
+    from telegram_client_wrapper import TelegramClientWrapper
+
+    monkeypatch.setattr(telegram_client_wrapper, "PARTICIPANTS_PAGE_SIZE", 2)
+    monkeypatch.setattr(telegram_client_wrapper, "PARTICIPANTS_PAGES_CONCURRENCY", 2)
+
+    def user(user_id):
+        return SimpleNamespace(
+            id=user_id,
+            first_name="",
+            last_name="",
+            username=f"u{user_id}",
+            phone="",
+            bot=False,
+            premium=False,
+            verified=False,
+        )
+
+    member_ids = list(range(10))
+    inviter = user(1000)
+    requested = []
+
+    async def fake_client(request):
+        requested.append(request.offset)
+        page_ids = member_ids[request.offset : request.offset + request.limit]
+        # users also lists the inviter the participants reference
+        return SimpleNamespace(
+            participants=[
+                SimpleNamespace(user_id=user_id, inviter_id=inviter.id)
+                for user_id in page_ids
+            ],
+            users=[inviter, *map(user, page_ids)] if page_ids else [],
+            count=len(member_ids),
+        )
+
+    client = TelegramClientWrapper()
+    client.client = fake_client
+    chat_info = {
+        "chat_id": 1,
+        "chat_title": "Канал",
+        "chat_type": "channel",
+        "entity": None,
+        "dialog": SimpleNamespace(is_channel=True),
+    }
+    received = []
+
+    async def on_members(chat_info, rows, done, failed):
+        received.append((list(requested), [row[3] for row in rows]))
+
+    await client.get_all_members([chat_info], on_members, batch_size=2)
+
+    # Страницы запрашиваются окнами по две и пишутся до запроса следующих
+    first_requested, first_rows = received[0]
+    assert first_rows == [0, 1]
+    assert max(first_requested) < 8
+    assert sorted(requested) == [0, 2, 4, 6, 8, 10]
+    assert [u for _, rows in received for u in rows] == list(range(10))
+
+
+async def test_request_retried_after_flood_wait(monkeypatch, capsys):
+    """Тест повтора запроса после FloodWait с сообщением в stderr."""
+    from telethon.errors import FloodWaitError
+
+    from telegram_client_wrapper import TelegramClientWrapper
+
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr("telegram_client_wrapper.asyncio.sleep", fake_sleep)
+    attempts = []
 
-        # Мок данных
-        mock_contacts = [{"id": 123, "first_name": "Test", "username": "test"}]
-        exporter.telegram_client.get_contacts = AsyncMock(return_value=mock_contacts)
+    async def request():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise FloodWaitError(request=None, capture=5)
+        return "ok"
 
-        # Экспорт
-        result = await exporter.export_contacts()
-        assert result == 1
+    client = TelegramClientWrapper()
+    assert await client._request_with_flood_retry(request) == "ok"
+    assert len(attempts) == 2
+    assert sleeps == [6]
+    captured = capsys.readouterr()
+    assert "5 сек" in captured.err
+    assert captured.out == ""